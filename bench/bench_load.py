@@ -0,0 +1,82 @@
+"""
+Loading a list from disk: games.json into plain dicts (how the bot used to keep games), games.json into Games, and
+games.bin into Games.
+
+    python bench/bench_load.py [--sizes 1000 10000 50000]
+
+Every load happens in a fresh process, like it does when the bot starts, so memory is just that list: how much the
+process grew (RSS) loading it and keeping it around, and the most it grew along the way. Each case runs a few times,
+and the best of each number is shown. Linux only, it reads /proc.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from synthetic import make_games
+from game import from_json, loads, to_binary
+
+cases = {
+    "json, dicts": lambda data: json.loads(data),
+    "json, Games": lambda data: loads(data),
+    "binary, Games": lambda data: loads(data),
+}
+
+
+def rss() -> int:
+    # Current resident memory in bytes.
+    with open("/proc/self/statm") as file:
+        return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def child(case: str, file_name: str):
+    with open(file_name, "rb") as file:
+        data = file.read()
+    load = cases[case]
+    before = rss()
+    peak_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    started = time.perf_counter()
+    games = load(data)
+    seconds = time.perf_counter() - started
+    held = rss() - before
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 - peak_before, held)
+    print(json.dumps({"seconds": seconds, "held": held, "peak": peak, "games": len(games)}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks loading lists of games in each format.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000], help="how many games in each list")
+    parser.add_argument("--runs", type=int, default=3, help="how many times to run each case")
+    parser.add_argument("--child", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return child(*args.child)
+
+    print(f"{'games':>6} {'format':<15} {'file':>9} {'load':>9} {'RSS held':>9} {'RSS peak':>9}")
+    with tempfile.TemporaryDirectory() as directory:
+        for count in args.sizes:
+            text = json.dumps(make_games(count), indent=4).encode("utf8")
+            files = {"json": os.path.join(directory, "games.json"), "binary": os.path.join(directory, "games.bin")}
+            with open(files["json"], "wb") as file:
+                file.write(text)
+            with open(files["binary"], "wb") as file:
+                file.write(to_binary(from_json(text)))
+            # The two formats have to hold exactly the same list, or none of this means anything.
+            with open(files["binary"], "rb") as file:
+                assert [game.to_dict() for game in loads(file.read())] == json.loads(text)
+            for case in cases:
+                file_name = files[case.split(",")[0]]
+                results = []
+                for _ in range(args.runs):
+                    output = subprocess.run([sys.executable, __file__, "--child", case, file_name], capture_output=True, check=True, text=True)
+                    results.append(json.loads(output.stdout))
+                result = {key: min(x[key] for x in results) for key in ["seconds", "held", "peak"]}
+                print(f"{count:>6} {case:<15} {os.path.getsize(file_name) / 2**20:>7.1f}MB {result['seconds']*1000:>7.1f}ms "
+                      f"{result['held'] / 2**20:>7.1f}MB {result['peak'] / 2**20:>7.1f}MB")
+
+
+if __name__ == "__main__":
+    main()
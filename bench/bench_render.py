@@ -0,0 +1,39 @@
+"""
+Render throughput: the plain template against the cached renderer, cold and warm.
+
+    python bench/bench_render.py
+"""
+import time
+from synthetic import make_games
+from game import Game
+from render import Renderer, default_template
+
+
+def timed(function, games: list[Game]) -> float:
+    started = time.perf_counter()
+    for game in games:
+        function(game, game.id)
+    return time.perf_counter() - started
+
+
+def main():
+    print(f"{'games':>6} {'case':<22} {'total':>9} {'per game':>10} {'games/s':>10}")
+    for count in [1000, 10000]:
+        games = [Game.from_dict(game) for game in make_games(count)]
+        renderer = Renderer(size=16384)
+        cases = [
+            ("uncached", lambda: timed(default_template.render, games)),
+            ("cache, cold", lambda: timed(renderer.render, games)),
+            ("cache, warm", lambda: timed(renderer.render, games)),
+        ]
+        for name, case in cases:
+            elapsed = case()
+            print(f"{count:>6} {name:<22} {elapsed*1000:>7.1f}ms {elapsed/count*1e6:>8.2f}us {count/elapsed:>10.0f}")
+        # One game changed, everything else is still in the cache, which is what a sync after an edit looks like.
+        games[count // 2].notes.append("something new")
+        elapsed = timed(renderer.render, games)
+        print(f"{count:>6} {'cache, one edit':<22} {elapsed*1000:>7.1f}ms {elapsed/count*1e6:>8.2f}us {count/elapsed:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
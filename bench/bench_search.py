@@ -0,0 +1,53 @@
+"""
+Game search: the trigram index against checking every name, on lists of 1k, 10k and 50k games.
+
+    python bench/bench_search.py
+"""
+import random
+import time
+from synthetic import make_games
+from search import GameIndex, normalize, trigrams
+
+
+def linear_search(names: dict[int, str], query: str, limit: int = 10) -> list[tuple[float, int]]:
+    # What we'd do without the index: score every name the same way the index does.
+    query_grams = trigrams(query)
+    results = []
+    for game_id, name in names.items():
+        grams = trigrams(name)
+        count = len(query_grams & grams)
+        results.append((0.8 * count / len(query_grams) + 0.2 * count / len(grams), game_id))
+    return sorted(results, reverse=True)[:limit]
+
+
+def typo(name: str, rng: random.Random) -> str:
+    # Drops, swaps or doubles a letter, like people do.
+    i = rng.randrange(len(name))
+    return rng.choice([name[:i] + name[i+1:], name[:i] + name[i+1:i+2] + name[i:i+1] + name[i+2:], name[:i] + name[i] + name[i:]])
+
+
+def main():
+    rng = random.Random(0)
+    print(f"{'games':>6} {'case':<14} {'build':>9} {'per query':>11} {'found':>7}")
+    for count in [1000, 10000, 50000]:
+        games = make_games(count)
+        targets = rng.sample(games, 200)
+        queries = [(typo(game["name"], rng), game["id"]) for game in targets]
+        started = time.perf_counter()
+        index = GameIndex()
+        for game in games:
+            index.add(game["id"], game["name"])
+        build = time.perf_counter() - started
+        names = {game["id"]: normalize(game["name"]) for game in games}
+        cases = [("index", build, lambda query: index.search(query)), ("linear scan", 0, lambda query: linear_search(names, query))]
+        for name, build, search in cases:
+            # The linear scan is slow enough that a few queries say all there is to say.
+            sample = queries if name == "index" or count <= 1000 else queries[:20]
+            started = time.perf_counter()
+            found = sum(any(game_id == target for _, game_id in search(query)) for query, target in sample)
+            elapsed = (time.perf_counter() - started) / len(sample)
+            print(f"{count:>6} {name:<14} {build*1000:>7.1f}ms {elapsed*1000:>9.3f}ms {found/len(sample):>7.0%}")
+
+
+if __name__ == "__main__":
+    main()
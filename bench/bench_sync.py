@@ -0,0 +1,186 @@
+"""
+What the bot's commands cost in discord calls and time, against the fake discord in fakediscord.py.
+
+Each size gets a fresh database and three list channels (two plain, one packed) in different servers, and runs through
+the scenarios in order, so each one starts from where the last left off. Edits go through the same background sync
+queue as the commands, debounce included. Times are simulated: what the calls and rate limits would have taken.
+
+    python bench/bench_sync.py [--sizes 100 1000 10000] [--check] [--no-memory]
+
+--check fails (exit code 1) if a scenario makes more calls per channel than it's allowed to, which is what CI runs.
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from rich.console import Console
+from synthetic import make_games
+from fakediscord import Api, FakeChannel, FakeGuild, FakeUser, VirtualClockLoop
+import channels
+import listsync
+from channels import ChannelRegistry
+from game import Game
+from listsync import ListMap, ListSyncer
+from store import StoreCache
+
+# Most calls each scenario should make per list channel, not counting reading history (a full sync reads the whole channel
+# whatever it finds). None means anything goes (building channels from scratch).
+budgets = {
+    "first sync": None,
+    "sync, nothing changed": 0,
+    "edit one game": 2,
+    "add a game at the top": 15,
+    "rename across the list": 15,
+    "batch of 100 edits": 110,  # A few games get pushed into the next pack in packed channels.
+    "full sync, a message gone": 15,  # Only the channel missing a message should change, up to the next gap or so.
+    "repair one channel": None,
+}
+call_kinds = ["history", "send", "edit", "delete", "bulk delete", "dm"]
+
+
+class World:
+    """A fake discord with a list of `count` games shown in three channels, and the syncer looking after them."""
+
+    def __init__(self, count: int, directory: str):
+        self.api = Api()
+        self.me = FakeUser(self.api, self.api.next_id(), "yuzu-compat-bot", bot=True)
+        self.channels = [
+            FakeChannel(self.api, FakeGuild(1, "yuzu"), self.me, "compat-list", "<yuzu-compat: list>"),
+            FakeChannel(self.api, FakeGuild(2, "switch modding"), self.me, "yuzu-games", "<yuzu-compat: list>"),
+            FakeChannel(self.api, FakeGuild(3, "emulation"), self.me, "games", "<yuzu-compat: list> <yuzu-compat: packed>"),
+        ]
+        with open(os.path.join(directory, "games.json"), "w", encoding="utf8") as file:
+            json.dump(make_games(count), file)
+        self.stores = StoreCache(os.path.join(directory, "games.json"), os.path.join(directory, "lists"))
+        self.registry = ChannelRegistry(os.path.join(directory, "channels.json"), [], [])
+        for channel in self.channels:
+            self.registry.update(channel)
+        self.syncer = ListSyncer(self.stores, self.registry, ListMap(os.path.join(directory, "listmap.json")))
+        self.syncer.bot_user = self.me
+        self.rng = random.Random(count)
+
+    async def change(self, change: dict):
+        # What an edit command does: one change, then ask for a sync and wait for it.
+        async with self.stores.use("default") as store, store:
+            await store.apply(change, "bench")
+        await self.syncer.queue_for("default").request()
+
+    async def random_game(self) -> Game:
+        store = await self.stores.get("default")
+        return self.rng.choice(store.games)
+
+    async def first_sync(self):
+        await self.syncer.sync("default")
+
+    async def nothing_changed(self):
+        await self.syncer.sync("default")
+
+    async def edit_one_game(self):
+        game = await self.random_game()
+        await self.change({"op": "append", "id": game.id, "category": "notes", "text": "runs at 60fps with the mod"})
+
+    async def add_at_top(self):
+        await self.change({"op": "add", "game": Game("0 A New Game").to_dict()})
+
+    async def rename_across(self):
+        # From the top of the list to the bottom, the furthest a game can move.
+        store = await self.stores.get("default")
+        game = min(store.games, key=lambda game: game.name.casefold())
+        await self.change({"op": "rename", "id": game.id, "name": "zzz " + game.name})
+
+    async def batch_of_edits(self):
+        store = await self.stores.get("default")
+        games = self.rng.sample(store.games, min(100, len(store.games)))
+        changes = [{"op": "append", "id": game.id, "category": "broken", "text": "crashes after the intro"} for game in games]
+        await self.change({"op": "batch", "changes": changes})
+
+    async def full_sync(self):
+        # Someone deleted a list message in the middle of the first channel (like a mod cleaning up, say).
+        messages = sorted(self.channels[0].messages)
+        del self.channels[0].messages[messages[len(messages) // 2]]
+        await self.syncer.sync("default", "full")
+
+    async def repair(self):
+        await self.syncer.repair(self.channels[0])
+
+    def scenarios(self):
+        return [
+            ("first sync", self.first_sync),
+            ("sync, nothing changed", self.nothing_changed),
+            ("edit one game", self.edit_one_game),
+            ("add a game at the top", self.add_at_top),
+            ("rename across the list", self.rename_across),
+            ("batch of 100 edits", self.batch_of_edits),
+            ("full sync, a message gone", self.full_sync),
+            ("repair one channel", self.repair),
+        ]
+
+
+def run(count: int, trace_memory: bool) -> list[dict]:
+    """Runs every scenario on a fresh world. With trace_memory, also measures peak memory (which slows everything down)."""
+    loop = VirtualClockLoop()
+    asyncio.set_event_loop(loop)
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        world = World(count, directory)
+        for name, scenario in world.scenarios():
+            calls = Counter(world.api.calls)
+            started = loop.time()
+            cpu_started = time.process_time()
+            if trace_memory:
+                tracemalloc.start()
+            loop.run_until_complete(scenario())
+            peak = tracemalloc.get_traced_memory()[1] if trace_memory else None
+            tracemalloc.stop()
+            results.append({
+                "scenario": name,
+                "calls": world.api.calls - calls,
+                "simulated": loop.time() - started,
+                "cpu": time.process_time() - cpu_started,
+                "peak": peak,
+                "channels": len(world.channels),
+            })
+        loop.run_until_complete(world.stores.close())
+    loop.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the bot's commands against a fake discord.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000], help="how many games in each database")
+    parser.add_argument("--check", action="store_true", help="fail if a scenario goes over its call budget")
+    parser.add_argument("--no-memory", action="store_true", help="skip the second, slower run that measures peak memory")
+    args = parser.parse_args()
+    # The bot's own progress logs would drown out the results.
+    channels.console = listsync.console = Console(file=io.StringIO())
+
+    failures = []
+    print(f"{'games':>6} {'scenario':<27} {'calls':>6} {'(' + ' / '.join(call_kinds) + ')':<46} {'simulated':>10} {'cpu':>8} {'peak mem':>9}")
+    for count in args.sizes:
+        results = run(count, trace_memory=False)
+        peaks = [None] * len(results) if args.no_memory else [result["peak"] for result in run(count, trace_memory=True)]
+        for result, peak in zip(results, peaks):
+            calls = result["calls"]
+            total = sum(calls.values())
+            by_kind = " / ".join(str(calls[kind]) for kind in call_kinds)
+            memory = "-" if peak is None else f"{peak / 2**20:.1f}MB"
+            print(f"{count:>6} {result['scenario']:<27} {total:>6} {'(' + by_kind + ')':<46} {result['simulated']:>9.1f}s "
+                  f"{result['cpu']*1000:>6.0f}ms {memory:>9}")
+            budget = budgets[result["scenario"]]
+            if budget is not None and total - calls["history"] > budget * result["channels"]:
+                failures.append(f"{count} games, {result['scenario']}: {total - calls['history']} calls (not counting history), "
+                                f"over the budget of {budget} per channel")
+    if args.check and failures:
+        print("\nOver budget:\n" + "\n".join(failures), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""
+A stand-in for the parts of discord the bot uses, so syncs and repairs can run without a token or a connection.
+
+Channels keep their messages in memory. Every call takes a made up round trip and waits out discord's rate limits for
+its route, all on a virtual clock (see `VirtualClockLoop`), so a sync that would take an hour against discord runs in
+a few seconds here and still says how long it would have taken.
+"""
+import asyncio
+import contextlib
+import datetime
+import itertools
+import selectors
+from collections import Counter, defaultdict, deque
+from typing import Optional
+import discord
+
+# (requests, per seconds) for each kind of call, per channel. Roughly what discord gives bots.
+default_limits = {
+    "history": (5, 1.0),  # One page of 100 messages.
+    "send": (5, 5.0),
+    "edit": (5, 5.0),
+    "delete": (5, 1.0),
+    "bulk delete": (1, 1.0),
+    "dm": (5, 5.0),
+}
+global_limit = (50, 1.0)  # Across everything.
+
+
+class VirtualClockLoop(asyncio.SelectorEventLoop):
+    """
+    An event loop whose clock only moves when there's nothing to do but wait, and then jumps straight to the next timer.
+    Sleeps cost nothing, but `time()` reads as if they'd really happened. Threads (the store's disk writes) still run for
+    real, and the clock stands still until they're done, so a timer further out can't jump ahead of them.
+    """
+
+    def __init__(self):
+        self.now = 0.0
+        self.threads = 0  # Executor jobs still running.
+        super().__init__(_VirtualSelector(self))
+
+    def time(self) -> float:
+        return self.now
+
+    def run_in_executor(self, executor, func, *args) -> asyncio.Future:
+        self.threads += 1
+        future = super().run_in_executor(executor, func, *args)
+        future.add_done_callback(self._thread_done)
+        return future
+
+    def _thread_done(self, future: asyncio.Future):
+        self.threads -= 1
+
+
+class _VirtualSelector(selectors.DefaultSelector):
+    def __init__(self, loop: VirtualClockLoop):
+        super().__init__()
+        self.loop = loop
+
+    def select(self, timeout=None):
+        events = super().select(0)
+        if events or timeout == 0:
+            return events
+        if timeout is None or self.loop.threads:
+            return super().select(None)  # Waiting on a thread, which has to really happen.
+        self.loop.now += timeout
+        return []
+
+
+class _Response:
+    # Just enough of an aiohttp response for discord.HTTPException.
+    def __init__(self, status: int, reason: str):
+        self.status = status
+        self.reason = reason
+
+
+def not_found() -> discord.NotFound:
+    return discord.NotFound(_Response(404, "Not Found"), "Unknown Message")
+
+
+class Api:
+    """Counts calls by kind, and makes each one wait like discord would. Shared by everything in one fake discord."""
+
+    def __init__(self, latency: float = 0.08, limits: dict[str, tuple[int, float]] = None):
+        self.latency = latency
+        self.limits = limits or default_limits
+        self.calls: Counter[str] = Counter()
+        self.waited = 0.0  # Seconds spent waiting on rate limits, across every route.
+        self._sent: dict[object, deque] = defaultdict(deque)  # route -> when its recent requests went out
+        self._routes: defaultdict[object, asyncio.Lock] = defaultdict(asyncio.Lock)
+        self._ids = itertools.count(discord.utils.time_snowflake(datetime.datetime.utcnow()))
+
+    def next_id(self) -> int:
+        return next(self._ids)
+
+    async def call(self, kind: str, route: int):
+        # Like discord.py, requests on one route go one at a time, each waiting for the one before to finish.
+        async with self._routes[(kind, route)]:
+            await self._take((kind, route), *self.limits[kind])
+            await self._take("global", *global_limit)
+            self.calls[kind] += 1
+            await asyncio.sleep(self.latency)
+
+    async def _take(self, route: object, limit: int, per: float):
+        loop = asyncio.get_event_loop()
+        sent = self._sent[route]
+        while True:
+            while sent and sent[0] + per <= loop.time():
+                sent.popleft()
+            if len(sent) < limit:
+                break
+            wait = sent[0] + per - loop.time()
+            self.waited += wait
+            await asyncio.sleep(wait)
+        sent.append(loop.time())
+
+
+class FakeUser:
+    def __init__(self, api: Api, user_id: int, name: str, bot: bool = False):
+        self.api = api
+        self.id = user_id
+        self.name = name
+        self.bot = bot
+        self.dms: list[str] = []
+
+    async def send(self, content: str):
+        await self.api.call("dm", self.id)
+        self.dms.append(content)
+
+    def __str__(self):
+        return self.name
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int, name: str):
+        self.id = guild_id
+        self.name = name
+        self.unavailable = False
+        self.text_channels: list["FakeChannel"] = []
+
+
+class FakeMessage:
+    def __init__(self, message_id: int, channel: "FakeChannel", author: FakeUser, content: str):
+        self.id = message_id
+        self.channel = channel
+        self.author = author
+        self.content = content
+
+    async def delete(self):
+        await self.channel.get_partial_message(self.id).delete()
+
+
+class FakePartialMessage:
+    def __init__(self, channel: "FakeChannel", message_id: int):
+        self.channel = channel
+        self.id = message_id
+
+    async def edit(self, content: str):
+        await self.channel.api.call("edit", self.channel.id)
+        if self.id not in self.channel.messages:
+            raise not_found()
+        self.channel.messages[self.id].content = content
+
+    async def delete(self):
+        await self.channel.api.call("delete", self.channel.id)
+        if self.channel.messages.pop(self.id, None) is None:
+            raise not_found()
+
+
+class FakeChannel(discord.TextChannel):
+    """
+    A text channel that lives in memory. It's a real TextChannel as far as isinstance is concerned (the bot bulk deletes
+    in those), but only the methods the bot uses are here. `me` is who sends the messages that `send` sends.
+    """
+
+    def __init__(self, api: Api, guild: FakeGuild, me: FakeUser, name: str, topic: Optional[str] = None):
+        self.api = api
+        self.guild = guild
+        self.me = me
+        self.name = name
+        self.topic = topic
+        self.id = api.next_id()
+        self.messages: dict[int, FakeMessage] = {}  # Oldest first, since ids only go up.
+        guild.text_channels.append(self)
+
+    def __repr__(self):
+        return f"<FakeChannel #{self.name} in {self.guild.name}>"
+
+    def post(self, author: FakeUser, content: str) -> FakeMessage:
+        # Someone else sending a message, for setting up scenarios. Doesn't count as one of our calls.
+        message = FakeMessage(self.api.next_id(), self, author, content)
+        self.messages[message.id] = message
+        return message
+
+    async def send(self, content: str) -> FakeMessage:
+        await self.api.call("send", self.id)
+        return self.post(self.me, content)
+
+    def get_partial_message(self, message_id: int) -> FakePartialMessage:
+        return FakePartialMessage(self, message_id)
+
+    async def delete_messages(self, messages: list):
+        # Like discord.py: one message goes through the normal delete, 2 to 100 are a bulk delete.
+        if len(messages) == 1:
+            return await self.get_partial_message(messages[0].id).delete()
+        if len(messages) > 100:
+            raise discord.ClientException("Can only bulk delete messages up to 100 messages")
+        await self.api.call("bulk delete", self.id)
+        for message in messages:
+            self.messages.pop(message.id, None)
+
+    async def history(self, limit: Optional[int] = 100, oldest_first: Optional[bool] = None):
+        # A page of 100 at a time, each page picking up after the last one, so messages that come and go while
+        # someone's reading the channel show up (or don't) the same way they would on discord.
+        cursor = None
+        returned = 0
+        while limit is None or returned < limit:
+            await self.api.call("history", self.id)
+            ids = sorted(self.messages, reverse=not oldest_first)
+            if cursor is not None:
+                ids = [x for x in ids if (x > cursor if oldest_first else x < cursor)]
+            page = ids[:100 if limit is None else min(100, limit - returned)]
+            for message_id in page:
+                if message_id in self.messages:
+                    yield self.messages[message_id]
+            returned += len(page)
+            if len(page) < 100:
+                return
+            cursor = page[-1]
+
+    def typing(self):
+        return contextlib.nullcontext()
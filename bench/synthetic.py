@@ -0,0 +1,38 @@
+import os
+import random
+import sys
+
+# The bot's modules live in src/, next to the bot itself.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from game import categories  # noqa: E402
+
+words = ["graphics", "audio", "crackling", "vulkan", "opengl", "shader", "cache", "stutter", "resolution", "docked",
+         "handheld", "async", "gpu", "emulation", "accuracy", "high", "normal", "fps", "unlock", "softlock", "cutscene",
+         "menu", "save", "online", "multiplayer", "texture", "flicker", "black", "screen", "boot", "title", "loads"]
+title_words = ["Super", "Mario", "Zelda", "Legend", "Breath", "Wild", "Kirby", "Pokemon", "Sword", "Shield", "Xenoblade",
+               "Chronicles", "Metroid", "Dread", "Fire", "Emblem", "Astral", "Chain", "Splatoon", "Party", "Kart", "Deluxe",
+               "Odyssey", "Smash", "Bros", "Ultimate", "Animal", "Crossing", "Horizons", "Octopath", "Traveler", "Bayonetta"]
+syllables = ["ka", "ro", "mi", "zel", "dra", "ton", "vi", "sha", "lor", "en", "ba", "yo", "ne", "ta", "qui", "mon", "ster",
+             "gal", "ax", "y", "fro", "st", "pun", "ch", "dor", "ia", "xe", "no", "bla", "de", "hol", "low", "kni", "ght"]
+
+
+def make_games(count: int, seed: int = 0) -> list[dict]:
+    """A made up list of games that looks roughly like the real one: unique names, a handful of short attributes each."""
+    rng = random.Random(seed)
+    games = []
+    names = set()
+    while len(games) < count:
+        # Mostly made up words, so there's as much variety in the names as in a real list, with some familiar ones mixed in.
+        name = " ".join(rng.choice(title_words) if rng.random() < 0.3 else
+                        "".join(rng.choice(syllables) for _ in range(rng.randint(2, 4))).capitalize()
+                        for _ in range(rng.randint(1, 4)))
+        if name in names:
+            name += f" {len(games)}"
+        names.add(name)
+        game = {"name": name, "id": len(games) + 1}
+        for category in categories:
+            game[category] = [" ".join(rng.choice(words) for _ in range(rng.randint(2, 12))) for _ in range(rng.choice([0, 0, 1, 1, 2, 3]))]
+        games.append(game)
+    games.sort(key=lambda game: game["name"].casefold())
+    return games
@@ -0,0 +1,77 @@
+import asyncio
+from typing import Callable
+import discord
+from rich.console import Console
+from render import message_limit, split_message
+
+console = Console()
+
+
+class LogPipeline:
+    """
+    Gets log entries out to the log channels without making anyone wait on them.
+
+    Entries go into a queue and `put` returns straight away (unless the queue is full, which only happens when the log
+    channels have been failing for a while). A background flusher picks them up every `interval` seconds, packs as many
+    as fit into each message, and sends them to all of that list's log channels at once, retrying a few times if discord
+    says no. `channels` gives the log channels of a list, and gets asked at send time, so channels can come and go.
+    """
+
+    def __init__(self, channels: Callable[[str], list[discord.TextChannel]], interval: float = 2.0, max_pending: int = 500,
+                 retries: int = 3):
+        self.channels = channels
+        self.interval = interval
+        self.retries = retries
+        self.queue: asyncio.Queue[tuple[str, str]] = asyncio.Queue(maxsize=max_pending)  # (list name, entry)
+        self._task = None
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    async def put(self, name: str, entry: str):
+        # Logs `entry` in the log channels of the list called `name`, and nowhere else.
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._flusher())
+        self._idle.clear()
+        await self.queue.put((name, entry))
+
+    async def flush(self):
+        # Wait until everything queued so far has been sent (or given up on).
+        if self._task is not None and not self._task.done():
+            await self._idle.wait()
+
+    def pack(self, entries: list[str]) -> list[str]:
+        messages = []
+        for entry in entries:
+            for part in split_message(entry):
+                if messages and len(messages[-1]) + 1 + len(part) <= message_limit:
+                    messages[-1] += "\n" + part
+                else:
+                    messages.append(part)
+        return messages
+
+    async def _flusher(self):
+        while True:
+            if self.queue.empty():
+                self._idle.set()
+            entries = [await self.queue.get()]
+            # Give the rest of a burst a moment to show up, so it goes out together.
+            await asyncio.sleep(self.interval)
+            while not self.queue.empty():
+                entries.append(self.queue.get_nowait())
+            by_list: dict[str, list[str]] = {}
+            for name, entry in entries:
+                by_list.setdefault(name, []).append(entry)
+            sends = [self._send(channel, self.pack(logged)) for name, logged in by_list.items() for channel in self.channels(name)]
+            await asyncio.gather(*sends, return_exceptions=True)
+
+    async def _send(self, channel: discord.TextChannel, messages: list[str]):
+        for message in messages:
+            for attempt in range(self.retries):
+                try:
+                    await channel.send(message)
+                    break
+                except discord.HTTPException:
+                    # discord.py already waits out rate limits, so this is discord having a bad time. Back off a bit.
+                    await asyncio.sleep(2 ** attempt)
+            else:
+                console.log(f"Gave up on sending a log message to <{channel.name}> in <{channel.guild.name}>.", style="red")
@@ -0,0 +1,146 @@
+import asyncio
+import json
+import re
+from typing import Optional
+import discord
+from rich.console import Console
+from store import write_atomic
+
+console = Console()
+list_pattern = re.compile(r"<yuzu-compat: list(?::([\w-]+))?>")
+log_pattern = re.compile(r"<yuzu-compat: log(?::([\w-]+))?>")
+
+
+def channel_kind(channel: discord.abc.GuildChannel) -> Optional[str]:
+    # What a channel's topic says it is. List channels take priority, so a channel can't be both.
+    topic = getattr(channel, "topic", None) or ""
+    if not isinstance(channel, discord.TextChannel):
+        return None
+    if list_pattern.search(topic):
+        return "list"
+    if log_pattern.search(topic):
+        return "log"
+    return None
+
+
+def list_name(topic: Optional[str], pattern: re.Pattern = list_pattern) -> str:
+    # Which list a list channel shows. <yuzu-compat: list:somename> is "somename", plain <yuzu-compat: list> is "default".
+    # The same goes for which list a log channel logs, with log_pattern.
+    match = pattern.search(topic or "")
+    return match.group(1).casefold() if match and match.group(1) else "default"
+
+
+class ChannelRegistry:
+    """
+    Remembers which channels are list and log channels, so startup doesn't have to read the topic of every channel the
+    bot can see. The registry is saved to disk, loaded on startup, and kept current by channel and guild events.
+    `reconcile` catches whatever the events missed (topics changed while the bot was offline, say), a guild at a time in
+    the background.
+
+    `list_channels` and `log_channels` are the lists the rest of the bot uses, kept up to date in place.
+    Both kinds also remember which list they're for (see `list_name`), a log channel only gets that list's log.
+    """
+
+    def __init__(self, file_name: str, list_channels: list[discord.TextChannel], log_channels: list[discord.TextChannel]):
+        self.file_name = file_name
+        self.list_channels = list_channels
+        self.log_channels = log_channels
+        self.kinds: dict[int, tuple[str, int, str]] = {}  # channel id -> (kind, guild id, list name)
+
+    def load(self):
+        try:
+            with open(self.file_name, "r", encoding="utf8") as file:
+                # Registries from before there were several lists don't have list names, those were all the default one.
+                # Log channels didn't have one until later either, and they logged the default list.
+                self.kinds = {int(channel_id): (kind, guild_id, name[0] if name and name[0] else "default")
+                              for channel_id, (kind, guild_id, *name) in json.load(file).items()}
+        except FileNotFoundError:
+            self.kinds = {}
+
+    async def save(self):
+        data = json.dumps({str(channel_id): list(entry) for channel_id, entry in self.kinds.items()})
+        await asyncio.to_thread(write_atomic, self.file_name, data)
+
+    def kind(self, channel_id: int) -> Optional[str]:
+        entry = self.kinds.get(channel_id)
+        return entry[0] if entry else None
+
+    def list_of(self, channel_id: int) -> Optional[str]:
+        entry = self.kinds.get(channel_id)
+        return entry[2] if entry else None
+
+    def lists(self, guild_id: int = None) -> set[str]:
+        # Every list that has a channel (in the guild, if given).
+        return {name for kind, guild, name in self.kinds.values() if kind == "list" and guild_id in (None, guild)}
+
+    def channels_of(self, name: str, kind: str = "list") -> list[discord.TextChannel]:
+        return [channel for channel in self._lists[kind] if self.list_of(channel.id) == name]
+
+    def resolve(self, bot: discord.Client):
+        # Fills the channel lists from the registry. Only looks up the channels we know about, not every channel there is.
+        # discord.py makes new channel objects when it reconnects, so this runs on every on_ready.
+        self.list_channels.clear()
+        self.log_channels.clear()
+        for channel_id, (kind, _, _) in self.kinds.items():
+            channel = bot.get_channel(channel_id)
+            if channel is not None:
+                self._lists[kind].append(channel)
+            # Channels we can't find stay registered, their guild might just be unavailable. reconcile sorts it out.
+
+    @property
+    def _lists(self) -> dict[str, list[discord.TextChannel]]:
+        return {"list": self.list_channels, "log": self.log_channels}
+
+    def update(self, channel: discord.abc.GuildChannel) -> bool:
+        # Call when a channel is created or changed. Returns whether that changed what kind of channel it is, or its list.
+        kind = channel_kind(channel)
+        name = list_name(channel.topic, log_pattern if kind == "log" else list_pattern) if kind else None
+        old = self.kinds.get(channel.id, (None, None, None))
+        for channels in self._lists.values():
+            # Swap in the newest channel object either way, so topic checks see the new topic.
+            channels[:] = [x for x in channels if x.id != channel.id]
+        if kind is None:
+            self.kinds.pop(channel.id, None)
+        else:
+            self.kinds[channel.id] = (kind, channel.guild.id, name)
+            self._lists[kind].append(channel)
+        if (kind, name) != (old[0], old[2]):
+            console.log(f"<{channel.name}> in <{channel.guild.name}> is now a {kind or 'regular'} channel"
+                        + (f" for the {name} list." if name else "."))
+            return True
+        return False
+
+    def remove(self, channel_id: int) -> bool:
+        for channels in self._lists.values():
+            channels[:] = [x for x in channels if x.id != channel_id]
+        return self.kinds.pop(channel_id, None) is not None
+
+    def remove_guild(self, guild_id: int) -> bool:
+        gone = [channel_id for channel_id, (_, guild, _) in self.kinds.items() if guild == guild_id]
+        for channel_id in gone:
+            self.remove(channel_id)
+        return bool(gone)
+
+    def scan_guild(self, guild: discord.Guild) -> bool:
+        # Checks every channel in a guild, and forgets registered ones that aren't there anymore.
+        changed = False
+        seen = set()
+        for channel in guild.text_channels:
+            seen.add(channel.id)
+            changed |= self.update(channel)
+        for channel_id in [x for x, (_, guild_id, _) in self.kinds.items() if guild_id == guild.id and x not in seen]:
+            changed |= self.remove(channel_id)
+        return changed
+
+    async def reconcile(self, guilds: list[discord.Guild]):
+        # The slow, thorough check, a guild at a time so the bot stays responsive while it runs.
+        changed = False
+        for guild in guilds:
+            if not guild.unavailable:
+                changed |= self.scan_guild(guild)
+            await asyncio.sleep(0)
+        known = {guild.id for guild in guilds}
+        for channel_id in [x for x, (_, guild_id, _) in self.kinds.items() if guild_id not in known]:
+            changed |= self.remove(channel_id)  # We've left that guild.
+        if changed:
+            await self.save()
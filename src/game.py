@@ -0,0 +1,175 @@
+import array
+import gc
+import json
+import struct
+import sys
+from typing import Optional
+
+# Interned, so comparing a category someone typed against these is mostly an identity check, and every game shares them.
+categories = tuple(sys.intern(category) for category in ("functional", "broken", "crashes", "recommendedsettings", "notes"))
+
+
+class Game:
+    """
+    One game on a list: its number, its name, and its attributes in each of the `categories`.
+    Slots instead of a dict, since there's one of these for every game on every loaded list, and the fields never change.
+    `from_dict` and `to_dict` go to and from the games.json format, and `from_dict` checks everything on the way in.
+    """
+    __slots__ = ("id", "name") + categories
+
+    def __init__(self, name: str, id: Optional[int] = None, functional: list[str] = None, broken: list[str] = None,
+                 crashes: list[str] = None, recommendedsettings: list[str] = None, notes: list[str] = None):
+        self.id = id  # None until the store numbers it.
+        self.name = name
+        self.functional = [] if functional is None else functional
+        self.broken = [] if broken is None else broken
+        self.crashes = [] if crashes is None else crashes
+        self.recommendedsettings = [] if recommendedsettings is None else recommendedsettings
+        self.notes = [] if notes is None else notes
+
+    def attributes(self, category: str) -> list[str]:
+        if category not in categories:
+            raise ValueError(f"{category!r} isn't a category.")
+        return getattr(self, category)
+
+    def sections(self) -> tuple[list[str], ...]:
+        # Every category's attributes, in `categories` order.
+        return self.functional, self.broken, self.crashes, self.recommendedsettings, self.notes
+
+    def copy(self) -> "Game":
+        return Game(self.name, self.id, *[list(section) for section in self.sections()])
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Game):
+            return NotImplemented
+        return self.id == other.id and self.name == other.name and self.sections() == other.sections()
+
+    def __repr__(self) -> str:
+        return f"<Game {self.id} {self.name!r}>"
+
+    @classmethod
+    def from_dict(cls, data: dict, copy: bool = True) -> "Game":
+        # copy=False hands the game the dict's own lists, for dicts nothing else is going to touch (like fresh from json).
+        if not isinstance(data, dict) or not isinstance(data.get("name"), str):
+            raise ValueError("Every game needs a name.")
+        name = data["name"]
+        game_id = data.get("id")
+        if game_id is not None and (type(game_id) is not int or game_id < 1):
+            raise ValueError(f"{name}'s number has to be a whole number above 0.")
+        sections = []
+        for category in categories:
+            section = data.get(category)
+            # Checking the types of the whole list in one go is a lot quicker than one at a time, on a big list.
+            if type(section) is not list or not {str}.issuperset(map(type, section)):
+                raise ValueError(f"{name} is missing {category}, or has something other than text in it.")
+            sections.append(list(section) if copy else section)
+        if len(data) > len(cls.__slots__) or len(data) == len(cls.__slots__) and game_id is None:
+            # Anything we don't know about would get lost the next time the list is saved.
+            unknown = data.keys() - {"id", "name", *categories}
+            raise ValueError(f"{name} has fields that games don't have: {', '.join(sorted(unknown))}.")
+        return cls(name, game_id, *sections)
+
+    def to_dict(self) -> dict:
+        # Same order as games.json has always had, number last since it was added later.
+        data = {"name": self.name}
+        for category, section in zip(categories, self.sections()):
+            data[category] = list(section)
+        if self.id is not None:
+            data["id"] = self.id
+        return data
+
+
+def from_json(data: bytes) -> list[Game]:
+    games = json.loads(data)
+    if not isinstance(games, list):
+        raise ValueError("A list of games has to be a JSON list.")
+    return [Game.from_dict(game, copy=False) for game in games]
+
+
+def to_json(games: list[Game]) -> bytes:
+    return json.dumps([game.to_dict() for game in games], indent=4).encode("utf8")
+
+
+# The binary format, for lists big enough that parsing games.json holds up startup. Little endian throughout:
+#     header: magic, version, number of games, number of ints, length of the text in bytes
+#     ints: for every game its number (0 for none), then how many attributes it has in each category (so 6 per game)
+#     text: every game's name followed by its attributes, all joined by NULs into one utf8 string
+# So loading is one decode and one split, and then slicing. Bump the version for any change.
+binary_magic = b"YZGL"
+binary_version = 1
+binary_header = struct.Struct("<4sHIII")
+
+
+def to_binary(games: list[Game]) -> bytes:
+    ints = array.array("I")
+    text = []
+    for game in games:
+        ints.append(game.id or 0)
+        text.append(game.name)
+        for section in game.sections():
+            ints.append(len(section))
+            text.extend(section)
+    strings = len(text)
+    text = "\0".join(text)
+    if text.count("\0") != max(strings - 1, 0):
+        raise ValueError("Something on the list has a NUL in it, so it can't be stored in the binary format.")
+    if sys.byteorder == "big":
+        ints.byteswap()
+    # surrogatepass, since JSON (so games.json) can hold lone surrogates, and this has to take whatever that does.
+    text = text.encode("utf8", "surrogatepass")
+    return binary_header.pack(binary_magic, binary_version, len(games), len(ints), len(text)) + ints.tobytes() + text
+
+
+def from_binary(data: bytes) -> list[Game]:
+    if len(data) < binary_header.size:
+        raise ValueError("That binary list is cut short or corrupt.")
+    magic, version, count, int_count, text_length = binary_header.unpack_from(data)
+    if magic != binary_magic:
+        raise ValueError("That isn't a binary list of games.")
+    if version != binary_version:
+        raise ValueError(f"That list is in version {version} of the binary format, this only reads version {binary_version}.")
+    end = binary_header.size + int_count * 4
+    if int_count != count * 6 or len(data) != end + text_length:
+        raise ValueError("That binary list is cut short or corrupt.")
+    ints = array.array("I", data[binary_header.size:end])
+    if sys.byteorder == "big":
+        ints.byteswap()
+    if not count:
+        return []
+    strings = data[end:].decode("utf8", "surrogatepass").split("\0")
+    if len(strings) != count + sum(ints) - sum(ints[::6]):  # A name for every game, plus every attribute.
+        raise ValueError("That binary list is cut short or corrupt.")
+    games = []
+    at = 0  # Where we are in strings.
+    for i in range(0, len(ints), 6):
+        game_id, functional, broken, crashes, recommendedsettings, notes = ints[i:i+6]
+        name = strings[at]
+        at += 1
+        games.append(Game(name, game_id or None,
+                          strings[at:(at := at + functional)],
+                          strings[at:(at := at + broken)],
+                          strings[at:(at := at + crashes)],
+                          strings[at:(at := at + recommendedsettings)],
+                          strings[at:(at := at + notes)]))
+    return games
+
+
+def loads(data: bytes) -> list[Game]:
+    # Either format, whichever it is. A big list is hundreds of thousands of new objects, none of them garbage, so the
+    # garbage collector sits this out instead of combing through all of them every few thousand.
+    collecting = gc.isenabled()
+    gc.disable()
+    try:
+        return from_binary(data) if data.startswith(binary_magic) else from_json(data)
+    finally:
+        if collecting:
+            gc.enable()
+
+
+def dumps(games: list[Game], binary: bool = False) -> bytes:
+    if binary:
+        try:
+            return to_binary(games)
+        except ValueError:
+            pass  # A NUL somewhere, which discord won't show anyway. JSON can hold it, and `loads` reads either.
+    return to_json(games)
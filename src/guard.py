@@ -0,0 +1,71 @@
+import asyncio
+import time
+import discord
+from rich.console import Console
+from listsync import delete_messages
+
+console = Console()
+
+
+class ChannelGuard:
+    """
+    Keeps other people's messages out of the list channels as they come in, so syncs never have to go looking for them.
+
+    Messages get deleted a moment after they arrive, so a few sent together go out as one bulk delete. Their authors get
+    a DM telling them off, but only once per `reprimand_cooldown` seconds each, and the DMs go out one at a time from the
+    background, at most `reprimands_per_minute`, so a raid can't get the bot rate limited (or flagged) for DM spam.
+    """
+
+    def __init__(self, delete_delay: float = 1.0, reprimand_cooldown: float = 3600.0, reprimands_per_minute: int = 5):
+        self.delete_delay = delete_delay
+        self.reprimand_cooldown = reprimand_cooldown
+        self.reprimands_per_minute = reprimands_per_minute
+        self._pending: dict[int, list[int]] = {}  # channel id -> messages waiting to be deleted
+        self._reprimanded: dict[int, float] = {}  # author id -> when we last told them off
+        self._reprimands: asyncio.Queue[tuple[discord.abc.User, discord.TextChannel]] = asyncio.Queue(maxsize=100)
+        self._reprimander = None
+        self.deleted = 0
+
+    def handle(self, message: discord.Message):
+        # Call for every message someone else sends in a list channel. Doesn't wait on discord for anything.
+        channel: discord.TextChannel = message.channel
+        if channel.id in self._pending:
+            self._pending[channel.id].append(message.id)
+        else:
+            self._pending[channel.id] = [message.id]
+            asyncio.ensure_future(self._delete_later(channel))
+        if "<yuzu-compat: noreprimand>" not in (channel.topic or ""):
+            self._reprimand(message.author, channel)
+
+    async def _delete_later(self, channel: discord.TextChannel):
+        await asyncio.sleep(self.delete_delay)
+        message_ids = self._pending.pop(channel.id)
+        try:
+            await delete_messages(channel, message_ids)
+            self.deleted += len(message_ids)
+        except discord.HTTPException as e:
+            console.log(f"Couldn't delete {len(message_ids)} messages in <{channel.name}> in <{channel.guild.name}>: {e}", style="red")
+
+    def _reprimand(self, author: discord.abc.User, channel: discord.TextChannel):
+        now = time.monotonic()
+        if now - self._reprimanded.get(author.id, -self.reprimand_cooldown) < self.reprimand_cooldown:
+            return
+        if len(self._reprimanded) > 1000:
+            # Forget anyone whose cooldown ran out, so this doesn't grow forever.
+            self._reprimanded = {k: v for k, v in self._reprimanded.items() if now - v < self.reprimand_cooldown}
+        self._reprimanded[author.id] = now
+        try:
+            self._reprimands.put_nowait((author, channel))
+        except asyncio.QueueFull:
+            return  # Lots of people at once. Their messages still get deleted, that's what matters.
+        if self._reprimander is None or self._reprimander.done():
+            self._reprimander = asyncio.ensure_future(self._send_reprimands())
+
+    async def _send_reprimands(self):
+        while not self._reprimands.empty():
+            author, channel = self._reprimands.get_nowait()
+            try:
+                await author.send(f"Please don't send messages in `#{channel.name}` in `{channel.guild.name}`. It'll break things.")
+            except discord.HTTPException:
+                pass  # DMs closed, nothing we can do.
+            await asyncio.sleep(60 / self.reprimands_per_minute)
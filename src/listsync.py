@@ -0,0 +1,586 @@
+import asyncio
+import bisect
+import datetime
+import hashlib
+import json
+import logging
+import math
+import re
+from collections import defaultdict
+from typing import Awaitable, Callable, Optional
+import discord
+from rich.console import Console
+from channels import ChannelRegistry
+from metrics import metrics
+from render import Renderer, pack_messages
+from store import GameStore, StoreCache, write_atomic
+
+console = Console()
+
+bulk_delete_limit = datetime.timedelta(days=14, minutes=-10)  # Discord only bulk deletes messages younger than 2 weeks.
+gap = "​"  # An empty slot in the list. Discord won't take a truly empty message, so it's a zero width space.
+
+
+class ListOutOfSync(Exception):
+    """What we know about a list channel doesn't match what's actually in it, so it needs a full sync (or a repair)."""
+
+
+def content_hash(content: str) -> str:
+    return hashlib.blake2b(content.encode("utf8"), digest_size=8).hexdigest()
+
+
+class ListMap:
+    """
+    Remembers, for every list channel, which message holds each slot of the list, a hash of what we last put in it,
+    and the key of what that was (the game numbers in it, see `pack_messages`, or None for gaps).
+    With this we can edit exactly the messages that changed, without ever reading the channel history.
+    """
+
+    def __init__(self, file_name: str):
+        self.file_name = file_name
+        self.channels: dict[int, list[list]] = {}  # channel id -> [[message id, content hash, key], ...] in list order
+
+    def load(self):
+        try:
+            with open(self.file_name, "r", encoding="utf8") as file:
+                self.channels = {int(channel_id): slots for channel_id, slots in json.load(file).items()}
+        except FileNotFoundError:
+            self.channels = {}
+
+    async def save(self):
+        data = json.dumps({str(channel_id): slots for channel_id, slots in self.channels.items()})
+        await asyncio.to_thread(write_atomic, self.file_name, data)
+
+
+api_calls = metrics.counter("yuzu_discord_calls_total", "Requests made to discord, by what kind of request.")
+rate_limited_seconds = metrics.counter("yuzu_rate_limited_seconds_total", "Time discord.py spent waiting out rate limits.").labels()
+sync_seconds = metrics.histogram("yuzu_sync_seconds", "How long list syncs took, by mode.")
+api_route = re.compile(r"/channels/(\d+)/messages(/bulk[-_]delete|/\d+)?(/reactions)?")
+
+
+class RateLimitWatch(logging.Handler):
+    """
+    Keeps a tally of how long discord.py held us back because of rate limits, by listening to its logging.
+    discord.py already queues requests per route bucket (and list channels each get their own buckets), this just
+    lets us see how much of a sync was spent waiting on them, in total and per channel.
+    It also counts every request discord.py makes, by kind, for the metrics. `is_dm` tells DMs apart from other sends.
+    """
+
+    def __init__(self, is_dm: Callable[[int], bool] = None):
+        super().__init__(logging.DEBUG)
+        self.waited = 0.0
+        self.by_channel: dict[int, float] = defaultdict(float)
+        self.is_dm = is_dm
+
+    def install(self):
+        logger = logging.getLogger("discord.http")
+        logger.setLevel(logging.DEBUG)  # The "bucket exhausted" and "has returned" messages are debug level.
+        logger.addHandler(self)
+
+    def emit(self, record: logging.LogRecord):
+        if record.msg.startswith("We are being rate limited."):
+            delay, bucket = record.args
+        elif record.msg.startswith("A rate limit bucket has been exhausted"):
+            bucket, delay = record.args
+        else:
+            if record.msg.endswith("has returned %s"):
+                method, url, *_ = record.args
+                api_calls.labels(kind=self.call_kind(method, str(url))).inc()
+            return
+        self.waited += float(delay)
+        rate_limited_seconds.inc(float(delay))
+        # Buckets look like "channel_id:guild_id:path".
+        channel_id = str(bucket).split(":")[0]
+        if channel_id.isdigit():
+            self.by_channel[int(channel_id)] += float(delay)
+
+    def call_kind(self, method: str, url: str) -> str:
+        match = api_route.search(url)
+        if match is None:
+            return "other"
+        channel_id, message, reactions = match.groups()
+        if reactions:
+            return "reaction"
+        if message and message[1:].startswith("bulk"):
+            return "bulk delete"
+        if method == "GET":
+            return "history"
+        if method == "POST":
+            return "dm" if self.is_dm is not None and self.is_dm(int(channel_id)) else "send"
+        return {"PATCH": "edit", "DELETE": "delete"}.get(method, "other")
+
+
+async def delete_messages(channel: discord.abc.Messageable, message_ids: list[int]):
+    """
+    Deletes a bunch of messages, 100 at a time where Discord lets us (guild channels, messages under 2 weeks old),
+    and one at a time everywhere else. Messages that are already gone are skipped.
+    """
+    single = message_ids
+    if isinstance(channel, discord.TextChannel):
+        # Snowflakes are timestamps, so anything above this one is young enough.
+        cutoff = discord.utils.time_snowflake(datetime.datetime.utcnow() - bulk_delete_limit)
+        young = [x for x in message_ids if x > cutoff]
+        single = [x for x in message_ids if x <= cutoff]
+        for start in range(0, len(young), 100):
+            batch = young[start:start+100]
+            try:
+                await channel.delete_messages([discord.Object(x) for x in batch])
+            except discord.Forbidden:
+                # No manage messages permission, but we can always delete our own messages one by one.
+                single += young[start:]
+                break
+            except discord.HTTPException:
+                # Probably one of them is already gone, so do this batch by hand.
+                single += batch
+    for message_id in single:
+        try:
+            await channel.get_partial_message(message_id).delete()
+        except discord.NotFound:
+            pass  # Already gone, which is what we wanted anyway.
+
+
+class MessageDeleter:
+    """Collects messages to delete while reading through a channel, and deletes them every 100 so nothing piles up."""
+
+    def __init__(self, channel: discord.abc.Messageable):
+        self.channel = channel
+        self.pending: list[int] = []
+
+    async def add(self, message_id: int):
+        self.pending.append(message_id)
+        if len(self.pending) >= 100:
+            await self.flush()
+
+    async def flush(self):
+        pending, self.pending = self.pending, []
+        await delete_messages(self.channel, pending)
+
+
+def make_layout(keys: list[str], gap_every: int) -> list[Optional[str]]:
+    # Leave an empty slot after every few messages, so an insert only has to shift messages up to the next gap.
+    layout = []
+    for num, key in enumerate(keys):
+        layout.append(key)
+        if gap_every and (num+1) % gap_every == 0:
+            layout.append(None)
+    return layout
+
+
+def _spread(items: list, room: int) -> list:
+    # Lays `items` out over `room` slots, with the slots left over spread evenly between them as gaps (None).
+    spare = room - len(items)
+    items = iter(items)
+    return [None if (x+1) * spare // room > x * spare // room else next(items) for x in range(room)]
+
+
+def _enough_gaps(room: int, count: int, total: int, gap_every: int) -> bool:
+    # Whether `room` slots hold `count` messages with enough gaps to spare, for a stretch of a list `total` messages long.
+    # Short stretches can run a lot thinner than `gap_every` before it matters, the whole list has to stay close to it, or
+    # it'd keep getting spread out again. Between the two it goes by how long the stretch is, on a log scale.
+    if count <= 2 * gap_every or total <= 2 * gap_every:
+        fraction = 0.25
+    else:
+        fraction = 0.25 + 0.5 * min(math.log(count / (2 * gap_every)) / math.log(total / (2 * gap_every)), 1.0)
+    return room - count >= count / gap_every * fraction
+
+
+class SyncPlan:
+    """What it takes to turn a channel's current slots into the wanted list. Build these with `plan_sync`."""
+
+    def __init__(self):
+        self.edits: list[tuple[int, Optional[str]]] = []  # (slot, key), key is None to turn the slot into a gap
+        self.sends: list[Optional[str]] = []  # keys to append at the bottom, None for a gap
+        self.deletes: list[int] = []  # slots to delete
+        self.layout: list[tuple[Optional[int], Optional[str]]] = []  # (old slot or None if sent, key) in the new order
+
+    @property
+    def calls(self) -> int:
+        return len(self.edits) + len(self.sends) + len(self.deletes)
+
+    def __str__(self):
+        return f"{self.calls} calls ({len(self.edits)} edits, {len(self.sends)} sends, {len(self.deletes)} deletes)"
+
+
+def _longest_increasing(pairs: list[tuple[int, int]]) -> list[tuple[int, int]]:
+    # Longest run of (position, slot) pairs whose slots are increasing, O(n log n). These can stay exactly where they are.
+    tails: list[int] = []  # slot at the end of the best run of each length
+    tail_index: list[int] = []  # which pair that was
+    previous = [-1] * len(pairs)
+    for num, (_, slot) in enumerate(pairs):
+        length = bisect.bisect_left(tails, slot)
+        if length == len(tails):
+            tails.append(slot)
+            tail_index.append(num)
+        else:
+            tails[length] = slot
+            tail_index[length] = num
+        previous[num] = tail_index[length-1] if length else -1
+    run = []
+    num = tail_index[-1] if tail_index else -1
+    while num != -1:
+        run.append(pairs[num])
+        num = previous[num]
+    run.reverse()
+    return run
+
+
+def plan_sync(slots: list[list], wanted: list[tuple[str, str]], gap_every: int = 0) -> SyncPlan:
+    """
+    Works out the cheapest way to get from `slots` (a channel's entry in the list map) to `wanted`, which is
+    (key, content hash) for every message in list order.
+
+    Messages that are already right and in the right order stay put. Everything else gets packed into the slots
+    between them, soaking up gaps where there are some, and the bottom of the list grows or shrinks as needed.
+    Inserts use up gaps, so whenever that means shifting messages further than a couple of gaps' worth, the stretch
+    being shifted grows until it has enough gaps in it and they get spread out evenly over it again. If the whole rest
+    of the list is short on gaps, it gets a gap every `gap_every` messages again, sending more at the bottom.
+    Otherwise every insert would end up shifting the rest of the list.
+    """
+    plan = SyncPlan()
+    where = {slot[1]: num for num, slot in enumerate(slots) if slot[2] is not None}
+    anchors = _longest_increasing([(position, where[digest]) for position, (_, digest) in enumerate(wanted) if digest in where])
+    anchors.append((len(wanted), len(slots)))  # The bottom of the list acts as one last anchor.
+
+    assigned: list[Optional[int]] = [None] * len(slots)  # which wanted position ends up in each slot
+    appended: list[Optional[int]] = []
+    last_position = last_slot = -1
+    num = 0
+    while num < len(anchors):
+        position, slot = anchors[num]
+        # Not enough room between these anchors, so let the next one move too and borrow its room.
+        borrowed = False
+        while slot - last_slot < position - last_position and num < len(anchors) - 1:
+            num += 1
+            position, slot = anchors[num]
+            borrowed = True
+        # Shifting this far means the gaps around here are used up, so keep borrowing until there's enough to go round.
+        rebalance = borrowed and gap_every and position - last_position - 1 > 2 * gap_every
+        while rebalance and not _enough_gaps(slot - last_slot - 1, position - last_position - 1, len(wanted), gap_every) \
+                and num < len(anchors) - 1:
+            num += 1
+            position, slot = anchors[num]
+        window = range(last_slot+1, slot)
+        positions = range(last_position+1, position)
+        if len(positions) > len(window) or rebalance and not _enough_gaps(len(window), len(positions), len(wanted), gap_every):
+            # Only happens at the bottom, where we can just send more messages. Everything in the window is moving anyway,
+            # so lay it out afresh with gaps like a full sync would, and send whatever doesn't fit.
+            layout = make_layout(list(positions), gap_every)
+            for x, wanted_position in zip(window, layout):
+                assigned[x] = wanted_position
+            appended = layout[len(window):]
+            break
+        if rebalance:
+            for x, wanted_position in zip(window, _spread(list(positions), len(window))):
+                assigned[x] = wanted_position
+        else:
+            # Leave gaps alone where we can, they cost nothing. Past that, free up slots from the bottom of the window.
+            spare = len(window) - len(positions)
+            unused = set()
+            for x in window:
+                if len(unused) == spare:
+                    break
+                if slots[x][2] is None:
+                    unused.add(x)
+            for x in reversed(window):
+                if len(unused) == spare:
+                    break
+                unused.add(x)
+            for x, wanted_position in zip([x for x in window if x not in unused], positions):
+                assigned[x] = wanted_position
+        if slot < len(slots):
+            assigned[slot] = position
+        last_position, last_slot = position, slot
+        num += 1
+
+    last_used = max((x for x, position in enumerate(assigned) if position is not None), default=-1)
+    for x, position in enumerate(assigned):
+        if position is not None:
+            key, digest = wanted[position]
+            if slots[x][1] != digest:
+                plan.edits.append((x, key))
+            plan.layout.append((x, key))
+        elif x > last_used and not appended and slots[x][2] is not None:
+            # Leftovers at the very bottom just go away.
+            plan.deletes.append(x)
+        else:
+            if slots[x][2] is not None:
+                plan.edits.append((x, None))
+            plan.layout.append((x, None))
+    for position in appended:
+        key = None if position is None else wanted[position][0]
+        plan.sends.append(key)
+        plan.layout.append((None, key))
+    return plan
+
+
+async def apply_plan(channel: discord.TextChannel, slots: list[list], plan: SyncPlan, render: Callable[[str], str]) -> list[list]:
+    """
+    Carries out a plan from `plan_sync`, and returns the channel's new slots. `render` gives the content for a key.
+    If discord errors partway through, the old slots are wrong and whatever got sent isn't in them, so that's a
+    ListOutOfSync too, and a full sync sorts it out.
+    """
+    contents = {}
+    new_slots = []
+    try:
+        for slot, key in plan.edits:
+            content = gap if key is None else render(key)
+            try:
+                await channel.get_partial_message(slots[slot][0]).edit(content=content)
+            except discord.NotFound:
+                raise ListOutOfSync(f"A list message in #{channel.name} went missing.")
+            contents[slot] = content
+        await delete_messages(channel, [slots[slot][0] for slot in plan.deletes])
+        for slot, key in plan.layout:
+            if slot is None:
+                content = gap if key is None else render(key)
+                message = await channel.send(content)
+                new_slots.append([message.id, content_hash(content), key])
+            elif slot in contents:
+                new_slots.append([slots[slot][0], content_hash(contents[slot]), key])
+            else:
+                new_slots.append(list(slots[slot]))
+    except discord.HTTPException as error:
+        raise ListOutOfSync(f"Discord gave an error partway through syncing #{channel.name}: {error}") from error
+    return new_slots
+
+
+async def full_sync(channel: discord.TextChannel, contents: dict[str, str], wanted: list[tuple[str, str]],
+                    bot_user: discord.ClientUser, gap_every: int = 0) -> list[list]:
+    """
+    The slow path: reads the whole channel, throws out foreign messages, and works out the slots from what's actually
+    there instead of trusting the list map. Then it's the same as a quick sync, so only what's wrong gets fixed, and the
+    gaps stay wherever quick syncs left them. `contents` and `wanted` are the same as for `plan_sync` and `apply_plan`.
+    Returns a fresh list of slots for the channel.
+    """
+    # Read through the channel oldest first, only keeping what we need of our own messages, and delete everyone else's.
+    # New messages get handled by the guard as they come in, so these are just ones sent while the bot was offline.
+    # No reprimands for those, a DM about something from hours ago is more confusing than helpful.
+    keys = {digest: key for key, digest in wanted}
+    keys[content_hash(gap)] = None
+    slots = []
+    foreign = MessageDeleter(channel)
+    async for message in channel.history(oldest_first=True, limit=None):
+        message: discord.Message
+        if message.author == bot_user:
+            digest = content_hash(message.content)
+            # Messages that aren't anything we want anymore get the hash as a key, so they're not mistaken for gaps.
+            slots.append([message.id, digest, keys.get(digest, digest)])
+            continue
+        await foreign.add(message.id)
+    await foreign.flush()
+    plan = plan_sync(slots, wanted, gap_every)
+    console.log(f"Fixing <{channel.name}> in <{channel.guild.name}>: {plan}.", style="green")
+    return await apply_plan(channel, slots, plan, contents.__getitem__)
+
+
+class SyncQueue:
+    """
+    Runs syncs in the background, one pass at a time. The first request starts a short wait, and everything that asks
+    for a sync during that wait (or while a pass is running) gets folded into the next pass, so a burst of edits
+    only syncs once or twice. `request()` gives back a future that's done once a pass covering it has finished.
+    """
+
+    def __init__(self, run: Callable[[], Awaitable], debounce: float = 3.0):
+        self.run = run
+        self.debounce = debounce
+        self._waiting: list[asyncio.Future] = []
+        self._task = None
+
+    def request(self) -> asyncio.Future:
+        future = asyncio.get_event_loop().create_future()
+        self._waiting.append(future)
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._worker())
+        return future
+
+    async def _worker(self):
+        while self._waiting:
+            await asyncio.sleep(self.debounce)
+            waiting, self._waiting = self._waiting, []
+            try:
+                await self.run()
+            except Exception as error:
+                for future in waiting:
+                    if not future.done():
+                        future.set_exception(error)
+            else:
+                for future in waiting:
+                    if not future.done():
+                        future.set_result(None)
+
+
+def is_packed(channel: discord.TextChannel) -> bool:
+    return "<yuzu-compat: packed>" in (channel.topic or "")
+
+
+class ListSyncer:
+    """
+    Keeps every list channel matching its list. Each list gets its own render cache, its own background sync queue
+    (see `SyncQueue`), and its own lock, so only one sync or repair touches a list's channels at a time, while different
+    lists sync side by side. Set `bot_user` once logged in, full syncs use it to tell our messages from everyone else's.
+    """
+
+    def __init__(self, stores: StoreCache, registry: ChannelRegistry, list_map: ListMap, rate_limits: RateLimitWatch = None,
+                 pack_every: int = 8, gap_every: int = 10, parallelism: int = 4, debounce: float = 3.0):
+        self.stores = stores
+        self.registry = registry
+        self.list_map = list_map
+        self.rate_limits = rate_limits or RateLimitWatch()
+        self.pack_every = pack_every
+        self.gap_every = gap_every
+        self.parallelism = parallelism
+        self.debounce = debounce
+        self.bot_user: Optional[discord.ClientUser] = None
+        self.renderers: dict[str, Renderer] = {}
+        self.locks: defaultdict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+        self.queues: dict[str, SyncQueue] = {}
+
+    def renderer_for(self, name: str) -> Renderer:
+        if name not in self.renderers:
+            # Big enough to hold a whole list, so a full sync never renders an unchanged game twice.
+            self.renderers[name] = Renderer(size=16384)
+        return self.renderers[name]
+
+    def forget(self, name: str):
+        # The list got unloaded, so its render cache can go too.
+        self.renderers.pop(name, None)
+
+    def queue_for(self, name: str) -> SyncQueue:
+        if name not in self.queues:
+            self.queues[name] = SyncQueue(lambda: self.sync(name, "quick"), debounce=self.debounce)
+        return self.queues[name]
+
+    async def sync(self, name: str, mode: str = "quick") -> list[str]:
+        """
+        Brings every channel showing the list up to date, and returns what was done in each. "quick" only touches what
+        changed, "full" reads every channel top to bottom, and "plan" just says what quick would do.
+        """
+        async with self.locks[name], self.stores.use(name) as store:
+            with sync_seconds.labels(mode=mode).time():
+                return await self._sync_channels(name, store, mode)
+
+    async def _sync_channels(self, name: str, store: GameStore, mode: str) -> list[str]:
+        # Only the channels showing this list, everyone else's can't have changed.
+        render = self.renderer_for(name).render
+        async with store as games:
+            # Sort the list of games, and render them while we're holding the lock so nothing changes halfway through.
+            # Games that didn't change come straight out of the render cache.
+            games: list
+            games.sort(key=lambda game: game.name.casefold())
+            if mode == "plan":
+                reordered, changed = store.reordered, store.changed
+            else:
+                reordered, changed = store.take_changes()
+            rendered = [(game.id, render(game, game.id)) for game in games]
+        channels = self.registry.channels_of(name)
+        if mode == "quick" and not reordered and not changed and all(channel.id in self.list_map.channels for channel in channels):
+            console.log("Nothing to sync.", style="green")
+            return []
+        # Packed and unpacked channels want different messages, so work each out once and share it between channels.
+        wanted_lists = {}
+
+        def wanted_for(channel: discord.TextChannel) -> tuple[dict[str, str], list[tuple[str, str]]]:
+            packed = is_packed(channel)
+            if packed not in wanted_lists:
+                messages = pack_messages(rendered, self.pack_every if packed else 1)
+                wanted_lists[packed] = (dict(messages), [(key, content_hash(content)) for key, content in messages])
+            return wanted_lists[packed]
+
+        plans = []
+        loop = asyncio.get_event_loop()
+        started = loop.time()
+        waited = self.rate_limits.waited
+        done = 0
+        # discord.py queues requests per route, and every channel has its own routes, so channels don't hold each other up.
+        # The semaphore is just so a pile of channels doesn't all hit the global rate limit at once.
+        parallel = asyncio.Semaphore(self.parallelism)
+
+        async def sync_channel(channel: discord.TextChannel):
+            nonlocal done
+            async with parallel:
+                channel_started = loop.time()
+                channel_waited = self.rate_limits.by_channel[channel.id]
+                with channel.typing() as _:
+                    summary = await self._sync_one_channel(channel, mode, store, *wanted_for(channel))
+                plans.append(f"#{channel.name} in {channel.guild.name}: {summary}")
+                done += 1
+                if mode != "plan":
+                    console.log(f"[{done}/{len(channels)}] Synced <{channel.name}> in <{channel.guild.name}>: {summary}, "
+                                f"took {loop.time()-channel_started:.1f}s "
+                                f"({self.rate_limits.by_channel[channel.id]-channel_waited:.1f}s rate limited).", style="green")
+
+        try:
+            results = await asyncio.gather(*[sync_channel(channel) for channel in channels], return_exceptions=True)
+            for result in results:
+                if isinstance(result, BaseException):
+                    raise result
+        except BaseException:
+            # Whatever we didn't get to still has to happen next time.
+            store.touch()
+            raise
+        finally:
+            await self.list_map.save()
+        if mode != "plan":
+            console.log(f"Done in {loop.time()-started:.1f}s, {self.rate_limits.waited-waited:.1f}s of that rate limited.", style="green")
+        return plans
+
+    async def _sync_one_channel(self, channel: discord.TextChannel, mode: str, store: GameStore, contents: dict[str, str],
+                                wanted: list[tuple[str, str]]) -> str:
+        slots = self.list_map.channels.get(channel.id)
+        if slots is not None and mode != "full":
+            plan = plan_sync(slots, wanted, self.gap_every)
+            if mode == "plan":
+                return str(plan)
+            console.log(f"Syncing <{channel.name}> in <{channel.guild.name}>: {plan}.", style="green")
+            try:
+                self.list_map.channels[channel.id] = await apply_plan(channel, slots, plan, contents.__getitem__)
+                return str(plan)
+            except ListOutOfSync as error:
+                console.log(f"{error} Falling back to a full sync.", style="yellow")
+                store.touch()
+            except BaseException:
+                # Anything else (like the connection dropping) could've stopped it halfway too, so the slots can't be trusted.
+                self.list_map.channels.pop(channel.id, None)
+                raise
+        if mode == "plan":
+            return "needs a full sync"
+        # Forget the channel until it's done, so if this blows up halfway we don't trust a half-right map.
+        self.list_map.channels.pop(channel.id, None)
+        console.log(f"Fully syncing <{channel.name}> in <{channel.guild.name}>.", style="green")
+        try:
+            self.list_map.channels[channel.id] = await full_sync(channel, contents, wanted, self.bot_user, self.gap_every)
+            return "full sync"
+        except ListOutOfSync as error:
+            if error.__cause__ is not None:
+                raise  # Discord having a bad time, not the channel changing. The next sync is a full one anyway.
+            await self.rebuild(channel)
+            return "repaired"
+
+    async def render_layout(self, name: str, packed: bool) -> list[tuple[Optional[str], str]]:
+        # Everything that goes in a list channel, gaps included, for when we're building one from scratch.
+        render = self.renderer_for(name).render
+        async with self.stores.use(name) as store, store.lock:
+            rendered = [(game.id, render(game, game.id)) for game in store.games]
+        messages = pack_messages(rendered, self.pack_every if packed else 1)
+        contents = dict(messages)
+        return [(key, gap if key is None else contents[key]) for key in make_layout([key for key, _ in messages], self.gap_every)]
+
+    async def repair(self, channel: discord.TextChannel):
+        # Throws out everything in the channel and sends the whole list again.
+        async with self.locks[self.registry.list_of(channel.id)]:
+            await self.rebuild(channel)
+
+    async def rebuild(self, channel: discord.TextChannel):
+        console.log(f"Repairing <{channel.name}> in <{channel.guild.name}>.", style="red bold")
+        self.list_map.channels.pop(channel.id, None)
+        with channel.typing() as _:
+            old_messages = MessageDeleter(channel)
+            async for message in channel.history(limit=None):
+                await old_messages.add(message.id)
+            await old_messages.flush()
+            slots = []
+            for key, content in await self.render_layout(self.registry.list_of(channel.id), is_packed(channel)):
+                message = await channel.send(content)
+                slots.append([message.id, content_hash(content), key])
+        self.list_map.channels[channel.id] = slots
+        await self.list_map.save()
@@ -0,0 +1,149 @@
+import bisect
+import time
+from contextlib import contextmanager
+from typing import Union
+
+# Upper bounds in seconds. Anything slower than the last one lands in +Inf.
+default_buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+
+class Gauge:
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Histogram:
+    """Counts how many observations fall under each bucket bound, which is cheap and still gives rough percentiles."""
+
+    def __init__(self, buckets: tuple[float, ...] = default_buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last one is +Inf.
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    @contextmanager
+    def time(self):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+    def percentile(self, fraction: float) -> float:
+        # The bucket bound that `fraction` of observations are under, so it's an upper estimate.
+        if not self.count:
+            return 0.0
+        wanted = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= wanted:
+                return bound
+        return float("inf")
+
+
+class Metric:
+    """One named metric, with a child (Counter, Gauge or Histogram) for every set of labels it's been used with."""
+
+    def __init__(self, name: str, kind: str, help: str, buckets: tuple[float, ...] = default_buckets):
+        self.name = name
+        self.kind = kind
+        self.help = help
+        self.buckets = buckets
+        self.children: dict[tuple, Union[Counter, Gauge, Histogram]] = {}
+
+    def labels(self, **labels) -> Union[Counter, Gauge, Histogram]:
+        key = tuple(sorted(labels.items()))
+        child = self.children.get(key)
+        if child is None:
+            child = self.children[key] = Histogram(self.buckets) if self.kind == "histogram" else Gauge() if self.kind == "gauge" else Counter()
+        return child
+
+
+class Metrics:
+    """
+    Every metric the bot keeps, in one place. Modules make theirs when they're imported, with `counter`, `gauge` and
+    `histogram`, and bump them as they go. `prometheus` writes them all out in Prometheus' text format.
+    """
+
+    def __init__(self):
+        self.metrics: dict[str, Metric] = {}
+
+    def _metric(self, name: str, kind: str, help: str, **kwargs) -> Metric:
+        if name not in self.metrics:
+            self.metrics[name] = Metric(name, kind, help, **kwargs)
+        return self.metrics[name]
+
+    def counter(self, name: str, help: str) -> Metric:
+        return self._metric(name, "counter", help)
+
+    def gauge(self, name: str, help: str) -> Metric:
+        return self._metric(name, "gauge", help)
+
+    def histogram(self, name: str, help: str, buckets: tuple[float, ...] = default_buckets) -> Metric:
+        return self._metric(name, "histogram", help, buckets=buckets)
+
+    def prometheus(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for key, child in sorted(metric.children.items()):
+                if isinstance(child, Histogram):
+                    seen = 0
+                    for bound, count in zip(list(child.buckets) + ["+Inf"], child.counts):
+                        seen += count
+                        lines.append(f"{metric.name}_bucket{_labels(key + (('le', bound),))} {seen}")
+                    lines.append(f"{metric.name}_sum{_labels(key)} {child.sum}")
+                    lines.append(f"{metric.name}_count{_labels(key)} {child.count}")
+                else:
+                    lines.append(f"{metric.name}{_labels(key)} {child.value}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> str:
+        # The same numbers, short enough to read in discord. Percentiles are bucket bounds, so "under" that much.
+        lines = []
+        for metric in self.metrics.values():
+            if not metric.children:
+                continue
+            lines.append(metric.help)
+            for key, child in sorted(metric.children.items()):
+                name = " ".join(str(value) for _, value in key) or "all"
+                if isinstance(child, Histogram):
+                    mean = child.sum / child.count if child.count else 0.0
+                    lines.append(f"  {name}: {child.count}x, mean {mean:.3f}s, "
+                                 f"p50 {_under(child, 0.5)}, p95 {_under(child, 0.95)}")
+                else:
+                    lines.append(f"  {name}: {child.value:.6g}")
+        return "\n".join(lines)
+
+
+def _under(histogram: Histogram, fraction: float) -> str:
+    bound = histogram.percentile(fraction)
+    return f"<{bound:g}s" if bound != float("inf") else f">{histogram.buckets[-1]:g}s"
+
+
+def _labels(key: tuple) -> str:
+    if not key:
+        return ""
+    escaped = [(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for name, value in key]
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+metrics = Metrics()
@@ -0,0 +1,166 @@
+import time
+from collections import OrderedDict
+from game import Game
+from metrics import metrics
+
+# Counters rather than a histogram, a render is a few microseconds and there are thousands per sync.
+render_seconds = metrics.counter("yuzu_render_seconds_total", "Time spent rendering games into messages.").labels()
+renders = metrics.counter("yuzu_renders_total", "Games rendered, by whether the render cache already had them.")
+render_hits, render_misses = renders.labels(cache="hit"), renders.labels(cache="miss")
+
+
+class Template:
+    """
+    How a game looks in a list channel. Subclass it and override whichever pieces you want to change, then hand it to
+    the renderer. Nothing else needs to know about the format.
+    """
+    sections = [
+        ("Functional", "functional"),
+        ("Broken", "broken"),
+        ("Crashes", "crashes"),
+        ("Recommended Settings", "recommendedsettings"),
+        ("Notes", "notes"),
+    ]
+    empty = "* None\n"
+    separator = "\n"
+    footer = "```"
+
+    def header(self, game: Game, number: int) -> str:
+        return f"```markdown\n[{number:03}]: {game.name}\n\n"
+
+    def section(self, title: str, items: list[str]) -> str:
+        return f"# {title}\n" + ("".join([f"{i+1}. {x}\n" for i, x in enumerate(items)]) or self.empty)
+
+    def render(self, game: Game, number: int) -> str:
+        body = self.separator.join([self.section(title, game.attributes(category)) for title, category in self.sections])
+        return self.header(game, number) + body + self.footer
+
+
+default_template = Template()
+
+
+class Renderer:
+    """
+    Renders games with a template, remembering the last few thousand results.
+    Entries are keyed on the game's contents and number, so a changed game can never get its old message back,
+    and the stale entry for a number is thrown out as soon as that number is rendered with new contents.
+    """
+
+    def __init__(self, template: Template = default_template, size: int = 16384):
+        self._template = template
+        self.size = size
+        self.cache: OrderedDict[tuple, str] = OrderedDict()
+        self.keys: dict[int, tuple] = {}  # number -> its current key, so a new render of it can evict the old entry
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def template(self) -> Template:
+        return self._template
+
+    @template.setter
+    def template(self, template: Template):
+        self._template = template
+        self.clear()
+
+    def clear(self):
+        self.cache.clear()
+        self.keys.clear()
+
+    def render(self, game: Game, number: int) -> str:
+        key = (number, game.name, *[tuple(section) for section in game.sections()])
+        message = self.cache.get(key)
+        if message is not None:
+            self.hits += 1
+            render_hits.inc()
+            self.cache.move_to_end(key)
+            return message
+        self.misses += 1
+        render_misses.inc()
+        started = time.perf_counter()
+        message = self._template.render(game, number)
+        render_seconds.inc(time.perf_counter() - started)
+        old_key = self.keys.get(number)
+        if old_key is not None:
+            self.cache.pop(old_key, None)
+        self.cache[key] = message
+        self.keys[number] = key
+        if len(self.cache) > self.size:
+            evicted, _ = self.cache.popitem(last=False)
+            if self.keys.get(evicted[0]) == evicted:
+                del self.keys[evicted[0]]
+        return message
+
+
+message_limit = 2000  # Discord's limit on message length.
+
+
+def split_message(content: str, limit: int = message_limit) -> list[str]:
+    """
+    Splits a message that's too long into several that aren't, between lines where possible.
+    If the message is one big code block, every part gets its own fences so they all still render.
+    """
+    if len(content) <= limit:
+        return [content]
+    opening, closing = "", ""
+    if content.startswith("```") and content.endswith("```") and "\n" in content:
+        opening = content[:content.index("\n")+1]
+        closing = "```"
+        content = content[len(opening):-len(closing)]
+    room = limit - len(opening) - len(closing) - 1  # -1 for the newline we may need before the closing fence
+    parts = []
+    current = ""
+    for line in content.splitlines(keepends=True):
+        while len(line) > room:
+            # A single line that doesn't fit anywhere, so it has to be cut.
+            if current:
+                parts.append(current)
+                current = ""
+            parts.append(line[:room])
+            line = line[room:]
+        if len(current) + len(line) > room:
+            parts.append(current)
+            current = ""
+        current += line
+    if current:
+        parts.append(current)
+    return [opening + part + ("" if not closing or part.endswith("\n") else "\n") + closing for part in parts]
+
+
+def _pack_boundary(game_id: int, every: int) -> bool:
+    # Whether a pack always ends after this game. It only depends on the game's own number, so changes elsewhere in the
+    # list can't move it, and packs stay put even when the games around them change.
+    return (game_id * 2654435761) % 2**32 % every == 0
+
+
+def pack_messages(rendered: list[tuple[int, str]], every: int = 8, limit: int = message_limit) -> list[tuple[str, str]]:
+    """
+    Turns rendered games (game id, message) into list messages (key, content), putting as many games in each message
+    as fit. Packs end when the next game doesn't fit, or after a game picked by `_pack_boundary` (about one in `every`),
+    so an edit can only ever shift pack boundaries up to the next one of those.
+    Pass every=1 to get one game per message. Games too long for one message are split over several of their own.
+    """
+    messages = []
+    keys: list[str] = []
+    content = ""
+
+    def finish():
+        nonlocal content
+        if keys:
+            messages.append(("+".join(keys), content))
+            keys.clear()
+            content = ""
+
+    for game_id, message in rendered:
+        if len(message) > limit:
+            finish()
+            messages += [(f"{game_id}:{num+1}", part) for num, part in enumerate(split_message(message, limit))]
+            continue
+        if keys and len(content) + 1 + len(message) > limit:
+            finish()
+        content = f"{content}\n{message}" if keys else message
+        keys.append(str(game_id))
+        if every <= 1 or _pack_boundary(game_id, every):
+            finish()
+    finish()
+    return messages
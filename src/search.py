@@ -0,0 +1,77 @@
+import heapq
+from collections import Counter
+import re
+
+
+def normalize(text: str) -> str:
+    return " ".join(re.sub(r"[^\w ]+", " ", text.casefold()).split())
+
+
+def trigrams(text: str) -> set[str]:
+    # Padding makes the start of each word count for more, which is where people tend to get names right.
+    padded = f"  {normalize(text).replace(' ', '  ')} "
+    return {padded[i:i+3] for i in range(len(padded) - 2)}
+
+
+class GameIndex:
+    """
+    Fuzzy lookup of games by name. Every name is broken into three letter pieces, and each piece remembers which games
+    have it, so a search only ever looks at games that share something with the query instead of the whole list.
+    Keep it up to date with `add` and `remove` (a rename is both).
+    """
+
+    def __init__(self):
+        self.names: dict[int, str] = {}  # game number -> normalized name
+        self.grams: dict[int, set[str]] = {}
+        self.postings: dict[str, set[int]] = {}
+        self.exact: dict[str, set[int]] = {}  # normalized name -> game numbers
+
+    def add(self, game_id: int, name: str):
+        if game_id in self.names:
+            self.remove(game_id)
+        grams = trigrams(name)
+        self.names[game_id] = normalize(name)
+        self.exact.setdefault(self.names[game_id], set()).add(game_id)
+        self.grams[game_id] = grams
+        for gram in grams:
+            self.postings.setdefault(gram, set()).add(game_id)
+
+    def remove(self, game_id: int):
+        name = self.names.pop(game_id, None)
+        if name is not None:
+            self.exact[name].discard(game_id)
+            if not self.exact[name]:
+                del self.exact[name]
+        for gram in self.grams.pop(game_id, ()):
+            games = self.postings[gram]
+            games.discard(game_id)
+            if not games:
+                del self.postings[gram]
+
+    def search(self, query: str, limit: int = 10) -> list[tuple[float, int]]:
+        """
+        Best matches first, as (score, game number). Scores go from 0 to 1, and an exact name match is always 1.
+        Names that share less than half of the query's pieces may not show up, they wouldn't be much of a match anyway.
+        """
+        query_grams = trigrams(query)
+        if not query_grams:
+            return []
+        # Anything that has at least half the query in it has to share one of its rarer half of pieces, so only games
+        # with one of those are worth scoring. That skips the huge lists for pieces like " th" that everything has.
+        # Counting those pieces gives a rough ranking for cheap, and only the best few of those get a proper score.
+        rarest = sorted(query_grams, key=lambda gram: len(self.postings.get(gram, ())))
+        rough = Counter()
+        for gram in rarest[:len(rarest) // 2 + 1]:
+            rough.update(self.postings.get(gram, ()))
+        normalized = normalize(query)
+        results = []
+        candidates = {game_id for game_id, _ in rough.most_common(limit * 8)} | self.exact.get(normalized, set())
+        for game_id in candidates:
+            count = len(query_grams & self.grams[game_id])
+            # How much of the query is in the name, with a little weight on how much of the name is in the query,
+            # so "zelda" prefers "Zelda" over "The Legend of Zelda: Skyward Sword HD".
+            score = 0.8 * count / len(query_grams) + 0.2 * count / len(self.grams[game_id])
+            if self.names[game_id] == normalized:
+                score = 1.0
+            results.append((score, game_id))
+        return heapq.nlargest(limit, results)
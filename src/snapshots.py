@@ -0,0 +1,170 @@
+import asyncio
+import datetime
+import gzip
+import json
+import os
+import time
+import weakref
+from rich.console import Console
+from game import Game
+from store import GameStore, StoreCache, write_atomic
+
+console = Console()
+
+
+def validate_games(games) -> list[dict]:
+    # Checks a list read from somewhere else (an upload, an old snapshot) looks like one we wrote, before it gets restored.
+    if not isinstance(games, list):
+        raise ValueError("That's not a list of games.")
+    ids = set()
+    for i, data in enumerate(games):
+        try:
+            game = Game.from_dict(data)
+        except ValueError as error:
+            raise ValueError(f"Game {i+1}: {error}")
+        if game.id is None or game.id in ids:
+            raise ValueError(f"{game.name} doesn't have a number, or shares it with another game.")
+        ids.add(game.id)
+    return games
+
+
+def read_snapshot(file_name: str) -> list[dict]:
+    with gzip.open(file_name, "rb") as file:
+        return json.load(file)
+
+
+class SnapshotKeeper:
+    """
+    Keeps compressed copies of every list, taken from memory (so always a finished state, never a file halfway through
+    being written) while holding the list's lock. A list gets a new one every `every` changes, or once `interval` seconds
+    have passed since the last one if anything changed at all. Only the newest `keep` are kept.
+
+    Snapshots are gzipped JSON, the same as games.json, in a snapshots folder next to the list's games.json. Each is
+    named after when it was taken, to the microsecond, so they sort oldest first. A snapshot never replaces another.
+    """
+
+    def __init__(self, stores: StoreCache, keep: int = 48, interval: float = 6 * 3600, every: int = 200, check_interval: float = 60.0):
+        self.stores = stores
+        self.keep = keep
+        self.interval = interval
+        self.every = every
+        self.check_interval = check_interval
+        # list name -> (the store, its mutations) as of its last snapshot. Only a weak reference, an evicted list has to be
+        # free to go, and one loaded again since isn't the same store.
+        self.taken: dict[str, tuple[weakref.ref, int]] = {}
+
+    def directory_for(self, name: str) -> str:
+        return os.path.join(os.path.dirname(self.stores.file_for(name)), "snapshots")
+
+    def snapshots(self, name: str) -> list[str]:
+        # File names, oldest first.
+        try:
+            return sorted(x for x in os.listdir(self.directory_for(name)) if x.startswith("games-") and x.endswith(".json.gz"))
+        except FileNotFoundError:
+            return []
+
+    def path(self, name: str, snapshot: str) -> str:
+        # Only ever one of ours, whatever someone typed.
+        if snapshot not in self.snapshots(name):
+            raise FileNotFoundError(f"There's no snapshot called {snapshot}.")
+        return os.path.join(self.directory_for(name), snapshot)
+
+    def changed_since(self, name: str, store: GameStore) -> int:
+        # How many changes the list has had since its last snapshot. A list loaded since then could have had any number,
+        # so that's as many as it's had since loading, and at least one.
+        taken = self.taken.get(name)
+        if taken is not None and taken[0]() is store:
+            return store.mutations - taken[1]
+        return max(store.mutations, 1)
+
+    def forget(self, name: str):
+        # For when a list's evicted.
+        self.taken.pop(name, None)
+
+    def due(self, name: str, store: GameStore) -> bool:
+        changes = self.changed_since(name, store)
+        if changes >= self.every:
+            return True
+        snapshots = self.snapshots(name)
+        if not snapshots:
+            return True
+        age = time.time() - os.path.getmtime(os.path.join(self.directory_for(name), snapshots[-1]))
+        return changes > 0 and age >= self.interval
+
+    async def take(self, name: str) -> str:
+        # Takes a snapshot and returns its file name.
+        async with self.stores.use(name) as store, store:
+            data = self._dump(name, store)
+        return await asyncio.to_thread(self._write, name, datetime.datetime.utcnow(), data)
+
+    async def take_locked(self, name: str, store: GameStore) -> str:
+        # The same, for callers already holding the store's lock, so nothing can change between the snapshot and whatever
+        # they do next. The lock stays held while it's written out.
+        return await asyncio.to_thread(self._write, name, datetime.datetime.utcnow(), self._dump(name, store))
+
+    def _dump(self, name: str, store: GameStore) -> bytes:
+        self.taken[name] = (weakref.ref(store), store.mutations)
+        return json.dumps([game.to_dict() for game in store.games]).encode("utf8")
+
+    def _write(self, name: str, taken: datetime.datetime, data: bytes) -> str:
+        directory = self.directory_for(name)
+        os.makedirs(directory, exist_ok=True)
+        # mtime=0 so the same list always compresses to the same bytes.
+        data = gzip.compress(data, compresslevel=6, mtime=0)
+        while True:
+            snapshot = f"games-{taken:%Y%m%d-%H%M%S-%f}.json.gz"
+            try:
+                write_atomic(os.path.join(directory, snapshot), data, replace=False)
+                break
+            except FileExistsError:
+                # Two in the same microsecond (or the clock went back). The next one along still sorts after it.
+                taken += datetime.timedelta(microseconds=1)
+        for old in self.snapshots(name)[:-self.keep]:
+            os.unlink(os.path.join(directory, old))
+        return snapshot
+
+    async def latest(self, name: str) -> str:
+        # The newest snapshot, taking one first if the list changed since.
+        async with self.stores.use(name) as store:
+            snapshots = self.snapshots(name)
+            if not snapshots or self.changed_since(name, store) > 0:
+                return await self.take(name)
+            return snapshots[-1]
+
+    async def delta(self, name: str, since: str) -> tuple[str, bytes]:
+        """
+        What changed between the snapshot `since` and now, as gzipped JSON: {"base": since, "snapshot": the newest one,
+        "games": [every game that's new or different], "removed": [numbers of games that are gone]}.
+        """
+        # Read the old one first, taking a new one could rotate it away.
+        old = await asyncio.to_thread(read_snapshot, self.path(name, since))
+        snapshot = await self.latest(name)
+        return snapshot, await asyncio.to_thread(self._delta, since, old, snapshot, self.path(name, snapshot))
+
+    @staticmethod
+    def _delta(since: str, old_games: list[dict], snapshot: str, new_file: str) -> bytes:
+        old = {game["id"]: game for game in old_games}
+        new = read_snapshot(new_file)
+        ids = {game["id"] for game in new}
+        delta = {
+            "base": since,
+            "snapshot": snapshot,
+            "games": [game for game in new if old.get(game["id"]) != game],
+            "removed": sorted(x for x in old if x not in ids),
+        }
+        return gzip.compress(json.dumps(delta).encode("utf8"), mtime=0)
+
+    async def run(self):
+        # The background part. Start it once, it checks every loaded list every `check_interval` seconds.
+        while True:
+            await asyncio.sleep(self.check_interval)
+            for name, store in list(self.stores.stores.items()):
+                try:
+                    if self.due(name, store):
+                        console.log(f"Took snapshot {await self.take(name)} of the {name} list.")
+                except OSError as e:
+                    console.log(f"Couldn't snapshot the {name} list: {e}", style="red")
+
+    def read(self, name: str, snapshot: str) -> list[dict]:
+        # Reads a snapshot back, checked and ready to restore. Blocks, so run it in a thread.
+        return validate_games(read_snapshot(self.path(name, snapshot)))
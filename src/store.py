@@ -0,0 +1,412 @@
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Optional, Union
+from game import Game, dumps, loads
+from metrics import metrics
+from search import GameIndex
+
+disk_seconds = metrics.histogram("yuzu_db_seconds", "Time spent reading and writing lists on disk, by what was being done.")
+
+
+def write_atomic(file_name: str, data: Union[str, bytes], replace: bool = True):
+    # Write next to the real file and swap it in, so a crash mid-write can never leave a truncated database behind.
+    # With replace=False, a file that's already there stays, and this raises FileExistsError instead.
+    directory = os.path.dirname(file_name) or "."
+    fd, temp_name = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(data if isinstance(data, bytes) else data.encode("utf8"))
+            file.flush()
+            os.fsync(file.fileno())
+        if replace:
+            os.replace(temp_name, file_name)
+        else:
+            os.link(temp_name, file_name)
+            os.unlink(temp_name)
+    except BaseException:
+        os.unlink(temp_name)
+        raise
+
+
+def snapshot_hash(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def apply_change(games: list[Game], by_id: dict[int, Game], change: dict):
+    # Replays one journal entry. The store checks changes before journaling them, so these can't fail.
+    op = change["op"]
+    if op == "add":
+        game = Game.from_dict(change["game"])
+        games.append(game)
+        by_id[game.id] = game
+        return
+    if op == "batch":
+        # Several changes as one journal entry, so they're either all there after a crash or none of them are.
+        for part in change["changes"]:
+            apply_change(games, by_id, part)
+        return
+    if op == "restore":
+        # The whole list, from a snapshot.
+        games[:] = [Game.from_dict(game) for game in change["games"]]
+        by_id.clear()
+        by_id.update((game.id, game) for game in games)
+        return
+    game = by_id[change["id"]]
+    if op == "rename":
+        game.name = change["name"]
+    elif op == "append":
+        game.attributes(change["category"]).append(change["text"])
+    elif op == "set":
+        game.attributes(change["category"])[change["index"]] = change["text"]
+    elif op == "delete":
+        game.attributes(change["category"]).pop(change["index"])
+    else:
+        raise ValueError(f"Unknown journal entry {op!r}.")
+
+
+class GameStore:
+    """
+    Keeps the list of games in memory for the lifetime of the bot.
+
+    Changes go through `apply` while holding the lock (`async with store as games:`). Each one is appended to a
+    journal and fsynced before it touches memory, so a change costs a few hundred bytes of disk instead of the whole
+    database. Every so often the journal gets compacted into a fresh games.json snapshot, and the entries it held
+    move to a history file. On startup, the journal is replayed on top of the snapshot.
+
+    The journal starts with the hash of the snapshot it belongs to, and the next game number to hand out. Compaction
+    writes the next journal first, then the snapshot, then swaps the journals, so whichever step a crash lands on,
+    startup can tell which journal to replay.
+
+    The snapshot is games.json, or games.bin in the binary format (see game.py) if that's the file name it's given.
+    A list that's only on disk in the other format gets converted when it's loaded, and the old file is renamed to .old.
+    """
+
+    def __init__(self, file_name: str, compact_every: int = 500, compact_delay: float = 300.0):
+        self.file_name = file_name
+        base = os.path.splitext(file_name)[0]
+        self.journal_name = base + ".journal"
+        self.history_name = base + ".history"
+        self.binary = file_name.endswith(".bin")
+        self.other_format_name = base + (".json" if self.binary else ".bin")
+        self.compact_every = compact_every
+        self.compact_delay = compact_delay
+        self.games: list[Game] = []
+        self.by_id: dict[int, Game] = {}
+        self.next_id = 1
+        self.index = GameIndex()  # Names, for finding games without their number.
+        self.lock = asyncio.Lock()
+        self._journal = None
+        self._journal_entries: list[str] = []  # Entries since the last snapshot, for the history file.
+        self._compact_task = None
+        self._compact_now = asyncio.Event()
+        # What the list channels are missing. `changed` holds the ids of games that changed since the last sync,
+        # `reordered` means we can't tell (like right after starting up), so every game needs checking.
+        self.changed: set[int] = set()
+        self.reordered = True
+        self.mutations = 0  # Changes since loading, so snapshots can tell when there's been enough to take another.
+        self.users = 0  # How many `StoreCache.use` blocks have it, it doesn't get evicted out from under any of them.
+
+    def load(self):
+        with disk_seconds.labels(op="load").time():
+            self._read()
+
+    def _read(self):
+        source = self.file_name
+        if not os.path.exists(source) and os.path.exists(self.other_format_name):
+            source = self.other_format_name  # Switched formats since it was last saved, it gets converted below.
+        with open(source, "rb") as file:
+            data = file.read()
+        self.games = loads(data)
+        self.by_id = {game.id: game for game in self.games if game.id is not None}
+        base = snapshot_hash(data)
+        # Numbers are never handed out twice, even ones a restore dropped, so the journal remembers the next one too.
+        self.next_id = max((game.id or 0 for game in self.games), default=0) + 1
+        self.next_id = max(self.next_id, self._recover_journal(base))
+        # Games keep their number forever, so that adding or renaming one doesn't renumber the whole list.
+        # Older databases don't have them yet, so number those in the order they're in, which is the order they were shown in.
+        numbered = False
+        for game in self.games:
+            if game.id is None:
+                game.id = self.next_id
+                self.next_id += 1
+                self.by_id[game.id] = game
+                numbered = True
+        self.index = GameIndex()
+        for game in self.games:
+            self.index.add(game.id, game.name)
+        if numbered or self._journal_entries or source != self.file_name:
+            self._compact()
+        else:
+            self._journal = open(self.journal_name, "a", encoding="utf8")
+        if source != self.file_name:
+            os.replace(source, source + ".old")
+
+    def _recover_journal(self, base: str) -> int:
+        # Replays the journal, and returns the next game number as far as it knows: the one saved when it was started,
+        # or one past any number it handed out since, whichever is higher.
+        # A next journal that belongs to this snapshot means we crashed right after writing the snapshot, so it wins.
+        next_name = self.journal_name + ".next"
+        if os.path.exists(next_name):
+            if self._journal_header(next_name).get("base") == base:
+                os.replace(next_name, self.journal_name)
+            else:
+                os.unlink(next_name)
+        header = self._journal_header(self.journal_name) if os.path.exists(self.journal_name) else {}
+        if header.get("base") != base:
+            # No journal yet, or one that the snapshot already includes.
+            write_atomic(self.journal_name, json.dumps({"base": base, "next_id": header.get("next_id", 1)}) + "\n")
+            return header.get("next_id", 1)
+        next_id = header.get("next_id", 1)  # Journals from before this was saved don't have it.
+        with open(self.journal_name, "r+", encoding="utf8") as file:
+            lines = file.readlines()
+            complete = len(lines) if lines[-1].endswith("\n") else len(lines) - 1
+            if complete < len(lines):
+                # We died halfway through writing the last entry, which was never confirmed, so drop it.
+                file.truncate(sum(len(line.encode("utf8")) for line in lines[:complete]))
+        for line in lines[1:complete]:
+            change = json.loads(line)
+            apply_change(self.games, self.by_id, change)
+            self._journal_entries.append(line)
+            for part in change["changes"] if change["op"] == "batch" else [change]:
+                if part["op"] == "add":
+                    next_id = max(next_id, part["game"]["id"] + 1)
+                elif part["op"] == "restore":
+                    next_id = max([next_id] + [game["id"] + 1 for game in part["games"]])
+        return next_id
+
+    @staticmethod
+    def _journal_header(file_name: str) -> dict:
+        try:
+            with open(file_name, "r", encoding="utf8") as file:
+                header = json.loads(file.readline())
+                return header if isinstance(header, dict) else {}
+        except ValueError:
+            return {}
+
+    async def __aenter__(self) -> list[Game]:
+        await self.lock.acquire()
+        return self.games
+
+    async def __aexit__(self, type, value, traceback):
+        self.lock.release()
+
+    def find(self, game_id: int) -> Optional[Game]:
+        return self.by_id.get(game_id)
+
+    def search(self, query: str, limit: int = 10) -> list[tuple[float, Game]]:
+        # Fuzzy name search, best first, as (score from 0 to 1, game).
+        return [(score, self.by_id[game_id]) for score, game_id in self.index.search(query, limit)]
+
+    async def apply(self, change: dict, author: str = None) -> dict:
+        """
+        Journals a change and then makes it. Only call this while holding the lock, after checking the change makes sense.
+        Changes look like {"op": "add", "game": {...}}, {"op": "rename", "id": 1, "name": "..."},
+        {"op": "append", "id": 1, "category": "notes", "text": "..."}, {"op": "set", ... "index": 0, "text": "..."}
+        or {"op": "delete", ... "index": 0}, or {"op": "batch", "changes": [...]} to make several of those all at once.
+        {"op": "restore", "games": [...]} swaps in a whole list (every game with its number), and gets compacted straight away.
+        Returns the change as journaled (adds get their game number filled in, in order, starting from `next_id`).
+        """
+        change = dict(change)
+        if change["op"] == "batch":
+            parts = change["changes"] = [dict(part) for part in change["changes"]]
+        else:
+            parts = [change]
+        next_id = self.next_id
+        for part in parts:
+            if part["op"] == "add":
+                # Through Game and back, so a game that isn't right fails here, before it gets journaled.
+                part["game"] = Game.from_dict(dict(part["game"], id=next_id)).to_dict()
+                next_id += 1
+        change["at"] = round(time.time(), 3)
+        change["by"] = author
+        line = json.dumps(change) + "\n"
+        # Once the journal has it, it has to make it into memory too, or the two disagree until the next restart and the
+        # replay trips over it. So this finishes even if whoever called it gets cancelled (like when logging out), and
+        # they only hear about it (still holding the lock) once it has.
+        commit = asyncio.ensure_future(self._commit(change, parts, line, next_id))
+        try:
+            return await asyncio.shield(commit)
+        except asyncio.CancelledError:
+            await asyncio.wait([commit])
+            raise
+
+    async def _commit(self, change: dict, parts: list[dict], line: str, next_id: int) -> dict:
+        await asyncio.to_thread(self._append, line)
+        apply_change(self.games, self.by_id, change)
+        self._journal_entries.append(line)
+        self.next_id = next_id
+        self.mutations += len(parts)
+        if change["op"] == "restore":
+            # Carry on numbering from where we were, rather than handing out the numbers of games the restore dropped.
+            self.next_id = max([self.next_id] + [game.id + 1 for game in self.games])
+            self.index = GameIndex()
+            for game in self.games:
+                self.index.add(game.id, game.name)
+            self.touch()
+            self._compact_now.set()  # No point replaying a whole list from the journal.
+            self._schedule_compaction()
+            return change
+        for part in parts:
+            game = self.by_id[part["game"]["id"] if part["op"] == "add" else part["id"]]
+            if part["op"] in ("add", "rename"):
+                self.index.add(game.id, game.name)
+            self.touch(game)
+        self._schedule_compaction()
+        return change
+
+    def _append(self, line: str):
+        with disk_seconds.labels(op="journal").time():
+            self._journal.write(line)
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+
+    def touch(self, game: Game = None):
+        # Call with the game that changed, or with nothing to have every game checked on the next sync.
+        if game is None:
+            self.reordered = True
+        else:
+            self.changed.add(game.id)
+
+    def take_changes(self) -> tuple[bool, set[int]]:
+        # Hands the pending changes to a sync. If the sync fails, it should `touch()` so nothing is missed.
+        changes = (self.reordered, self.changed)
+        self.reordered = False
+        self.changed = set()
+        return changes
+
+    def _schedule_compaction(self):
+        # Compact a while after the first change, or straight away once the journal gets long.
+        if self._compact_task is None or self._compact_task.done():
+            self._compact_task = asyncio.ensure_future(self._compact_later())
+        if len(self._journal_entries) >= self.compact_every:
+            self._compact_now.set()
+
+    async def _compact_later(self):
+        try:
+            await asyncio.wait_for(self._compact_now.wait(), self.compact_delay)
+        except asyncio.TimeoutError:
+            pass
+        self._compact_now.clear()
+        await self.flush()
+
+    async def flush(self):
+        # Folds the journal into a fresh snapshot. Holds the lock throughout, changes just wait for it.
+        async with self.lock:
+            if self._journal_entries:
+                await asyncio.to_thread(self._compact)
+
+    async def close(self):
+        # Writes everything out and lets go of the journal. Don't use the store after this.
+        if self._compact_task is not None and not self._compact_task.done():
+            self._compact_now.set()
+            await self._compact_task
+        await self.flush()
+        async with self.lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+
+    def _compact(self):
+        with disk_seconds.labels(op="save").time():
+            self._write()
+
+    def _write(self):
+        data = dumps(self.games, self.binary)
+        next_name = self.journal_name + ".next"
+        write_atomic(next_name, json.dumps({"base": snapshot_hash(data), "next_id": self.next_id}) + "\n")
+        write_atomic(self.file_name, data)
+        # The snapshot has everything now. Keep the entries around as history, then move to the new journal.
+        if self._journal_entries:
+            with open(self.history_name, "a", encoding="utf8") as history:
+                history.writelines(self._journal_entries)
+                history.flush()
+                os.fsync(history.fileno())
+        if self._journal is not None:
+            self._journal.close()
+        os.replace(next_name, self.journal_name)
+        self._journal = open(self.journal_name, "a", encoding="utf8")
+        self._journal_entries = []
+
+
+class StoreCache:
+    """
+    One GameStore per list, loaded the first time something asks for it. The "default" list lives in `default_file`
+    (games.json, like before there were several), and every other one gets its own folder in `directory`.
+    Once the loaded lists add up to more than `max_games` games, the ones used longest ago are written out and dropped
+    until they're needed again. The one just asked for always stays, and so does any that's in use: get stores with
+    `async with stores.use(name) as store:` rather than `get` whenever there's an await between getting it and being done
+    with it, even if the whole time is spent waiting on its lock.
+    """
+
+    def __init__(self, default_file: str, directory: str, max_games: int = 100000, on_evict: Callable[[str], None] = None,
+                 binary: bool = False):
+        self.default_file = default_file
+        self.directory = directory
+        self.max_games = max_games
+        self.on_evict = on_evict
+        self.binary = binary
+        self.stores: OrderedDict[str, GameStore] = OrderedDict()  # Least recently used first.
+        self._lock = asyncio.Lock()  # Loading and evicting, so two commands can't load the same list twice.
+
+    def file_for(self, name: str) -> str:
+        file_name = self.default_file if name == "default" else os.path.join(self.directory, name, "games.json")
+        return os.path.splitext(file_name)[0] + ".bin" if self.binary else file_name
+
+    async def get(self, name: str) -> GameStore:
+        store = self.stores.get(name)
+        if store is None:
+            async with self._lock:
+                store = self.stores.get(name)
+                if store is None:
+                    store = GameStore(self.file_for(name))
+                    await asyncio.to_thread(self._load, store)
+                    self.stores[name] = store
+                    await self._evict()
+        self.stores.move_to_end(name)
+        return store
+
+    @asynccontextmanager
+    async def use(self, name: str) -> AsyncIterator[GameStore]:
+        store = await self.get(name)
+        store.users += 1
+        try:
+            yield store
+        finally:
+            store.users -= 1
+
+    @staticmethod
+    def _load(store: GameStore):
+        if not os.path.exists(store.file_name) and not os.path.exists(store.other_format_name):
+            # A brand new list.
+            os.makedirs(os.path.dirname(store.file_name), exist_ok=True)
+            write_atomic(store.file_name, dumps([], store.binary))
+        store.load()
+
+    async def _evict(self):
+        for name, store in list(self.stores.items())[:-1]:
+            if sum(len(x.games) for x in self.stores.values()) <= self.max_games:
+                break
+            if store.users or store.lock.locked():
+                continue  # In use, it can go next time.
+            del self.stores[name]
+            await store.close()
+            if self.on_evict is not None:
+                self.on_evict(name)
+
+    def busy(self) -> bool:
+        return any(store.lock.locked() for store in self.stores.values())
+
+    async def flush(self):
+        for store in list(self.stores.values()):
+            await store.flush()
+
+    async def close(self):
+        for store in list(self.stores.values()):
+            await store.close()
+        self.stores.clear()
@@ -1,9 +1,7 @@
-import json
-# from typing import Optional
+from typing import AsyncIterator, Optional
 from discord.enums import Status
 from discord.ext import commands
 import discord
-from discord.ext.commands.cooldowns import BucketType
 from discord.ext.commands.errors import BadArgument, CheckFailure, CommandNotFound
 from discord.ext.commands.errors import MissingRequiredArgument, NotOwner, TooManyArguments
 from rich import traceback
@@ -11,129 +9,232 @@ from rich.console import Console
 from inspect import cleandoc as multiline
 from binascii import Error as BinAsciiError
 import base64
+from contextlib import asynccontextmanager
+import csv
+import gzip
+import io
+import json
+import asyncio
+import re
+import time
+from store import GameStore, StoreCache, apply_change, write_atomic
+from auditlog import LogPipeline
+from guard import ChannelGuard
+from channels import ChannelRegistry, channel_kind
+from snapshots import SnapshotKeeper, validate_games
+from render import split_message
+from game import Game, categories
+from metrics import metrics
+from listsync import ListMap, ListSyncer, RateLimitWatch
 
 console = Console()
 # traceback.install(console=console, extra_lines=5, word_wrap=True, show_locals=True)
-database_location = "db/games.json"
+database_location = "db/games.json"  # The default list. Lists with their own name live in lists_location.
+lists_location = "db/lists"
+binary_database = False  # Keep lists as games.bin instead of games.json, which loads quicker. Lists convert themselves either way.
+max_loaded_games = 100000  # Lists that haven't been used in a while get unloaded once the loaded ones add up to more games than this.
+list_map_location = "db/listmap.json"
+channel_registry_location = "db/channels.json"
+sync_parallelism = 4  # How many list channels get synced at once.
+sync_debounce = 3.0  # Seconds to wait for more changes before syncing, so a burst of edits is one sync.
+log_interval = 2.0  # Seconds to collect log entries for before sending them as one message.
+react_when_live = True  # React with ✅ on edits once they've made it into the list channels.
+list_pack_every = 8  # In channels with <yuzu-compat: packed> in the topic, a pack of games always ends about this often.
+list_gap_every = 10  # Leave an empty message after this many games, so inserts don't have to shift the whole list. 0 turns it off.
+search_confidence = 0.6  # How good a name match has to be (from 0 to 1) for commands to go with it without asking.
+search_margin = 0.15  # ...and how far ahead of the next best match.
+reprimand_cooldown = 3600.0  # Seconds before someone who messaged in a list channel gets told off again.
+reprimands_per_minute = 5  # Most DMs to send telling people off, across everyone, so a raid doesn't get us rate limited.
+reconcile_delay = 30.0  # Seconds after connecting before double checking every channel's topic in the background.
+reconcile_interval = 3600.0  # ...and don't do that more than once an hour, however often we reconnect.
+metrics_location = "db/metrics.prom"  # For Prometheus' node exporter (textfile collector) to pick up.
+metrics_interval = 60.0  # Seconds between writing it out.
+snapshot_every = 200  # Changes to a list before it gets another compressed snapshot (kept in a snapshots folder next to it)...
+snapshot_interval = 6 * 3600.0  # ...or seconds, if it's changed at all.
+snapshot_keep = 48  # How many snapshots of each list to keep.
 
 bot = commands.Bot(command_prefix=">")
 list_channels: list[discord.TextChannel] = []
 log_channels: list[discord.TextChannel] = []
-db_lock: bool = False  # To prevent the funny race conditions from ocurring.
-
-
-def convert_game_dict_to_message(game: dict, number: int) -> str:
-    functional = ""
-    found = False
-    for i, x in enumerate(game["functional"]):
-        functional += f"{i+1}. {x}\n"
-        found = True
-    if not found:
-        functional += "* None\n"
-
-    broken = ""
-    found = False
-    for i, x in enumerate(game["broken"]):
-        broken += f"{i+1}. {x}\n"
-        found = True
-    if not found:
-        broken += "* None\n"
-
-    crashes = ""
-    found = False
-    for i, x in enumerate(game["crashes"]):
-        crashes += f"{i+1}. {x}\n"
-        found = True
-    if not found:
-        crashes += "* None\n"
-
-    settings = ""
-    found = False
-    for i, x in enumerate(game["recommendedsettings"]):
-        settings += f"{i+1}. {x}\n"
-        found = True
-    if not found:
-        settings += "* None\n"
-
-    notes = ""
-    found = False
-    for i, x in enumerate(game["notes"]):
-        notes += f"{i+1}. {x}\n"
-        found = True
-    if not found:
-        notes += "* None\n"
-
-    message = "```markdown\n"
-    message += f"[{number:03}]: {game['name']}\n"
-    message += f"\n"
-    message += f"# Functional\n"
-    message += f"{functional}\n"
-    message += f"# Broken\n"
-    message += f"{broken}\n"
-    message += f"# Crashes\n"
-    message += f"{crashes}\n"
-    message += f"# Recommended Settings\n"
-    message += f"{settings}\n"
-    message += f"# Notes\n"
-    message += f"{notes}"
-    message += f"```"
-    return message
-
-# Custom context manager to open a json file for writing
-
-
-class JsonFile:
-    def __init__(self, file_name, mode="r+", encoding="utf8"):
-        self.file = open(file_name, mode=mode, encoding=encoding)
-        self.obj = json.load(self.file, )
-
-    def __enter__(self):
-        db_lock = True
-        return self.obj
-
-    def __exit__(self, type, value, traceback):
-        if self.file.writable():
-            self.file.seek(0)
-            json.dump(self.obj, self.file, indent=4)
-            self.file.truncate()
-        self.file.close()
-        db_lock = False
+stores = StoreCache(database_location, lists_location, max_games=max_loaded_games, binary=binary_database)
+registry = ChannelRegistry(channel_registry_location, list_channels, log_channels)
+log_pipeline = LogPipeline(lambda name: registry.channels_of(name, "log"), interval=log_interval)
+list_map = ListMap(list_map_location)
+rate_limits = RateLimitWatch(is_dm=lambda channel_id: isinstance(bot.get_channel(channel_id), discord.DMChannel))
+syncer = ListSyncer(stores, registry, list_map, rate_limits, pack_every=list_pack_every, gap_every=list_gap_every,
+                    parallelism=sync_parallelism, debounce=sync_debounce)
+last_reconcile: Optional[float] = None
+guard = ChannelGuard(reprimand_cooldown=reprimand_cooldown, reprimands_per_minute=reprimands_per_minute)
+metrics_writer: Optional[asyncio.Task] = None
+snapshots = SnapshotKeeper(stores, keep=snapshot_keep, interval=snapshot_interval, every=snapshot_every)
+snapshot_taker: Optional[asyncio.Task] = None
+command_seconds = metrics.histogram("yuzu_command_seconds", "How long commands took, by command and whether they worked.")
+loaded_lists = metrics.gauge("yuzu_loaded_lists", "Lists loaded in memory.").labels()
+loaded_games = metrics.gauge("yuzu_loaded_games", "Games in the lists loaded in memory.").labels()
+known_channels = metrics.gauge("yuzu_channels", "List and log channels the bot knows about, by kind.")
+deleted_messages = metrics.gauge("yuzu_guard_deleted_messages", "Messages other people sent in list channels that got deleted.").labels()
+
+
+def forget_list(name: str):
+    # An evicted list's gone from memory, nothing should be holding on to it.
+    syncer.forget(name)
+    snapshots.forget(name)
+
+
+stores.on_evict = forget_list
 
 
 def db_access(ctx):
-    return not db_lock
+    return not stores.busy()
 
 
 def valid_user_check(ctx: commands.Context):
     return ctx.author.id == 134509976956829697 or 809853472316981279 in [x.id for x in ctx.author.roles]
 
 
-async def log(message: str):
+commands_pattern = re.compile(r"<yuzu-compat: commands:([\w-]+)>")
+
+
+def list_for(ctx: commands.Context) -> str:
+    # Which list a command is about. In a server with one list, that one. In a server with a few, the one the channel
+    # topic names with <yuzu-compat: commands:name>, or the one shown in the channel itself. Otherwise the default list.
+    if ctx.guild is None:
+        return "default"
+    match = commands_pattern.search(getattr(ctx.channel, "topic", None) or "")
+    if match:
+        return match.group(1).casefold()
+    if registry.kind(ctx.channel.id) == "list":
+        return registry.list_of(ctx.channel.id)
+    names = registry.lists(ctx.guild.id)
+    if len(names) > 1:
+        raise BadArgument(f"This server has a few lists ({', '.join(sorted(names))}), "
+                          "use a channel with <yuzu-compat: commands:listname> in the topic to say which one.")
+    return names.pop() if names else "default"
+
+
+@asynccontextmanager
+async def store_for(ctx: commands.Context) -> AsyncIterator[tuple[str, GameStore]]:
+    # The list a command is about and its store, which stays loaded until the block is done with it.
+    name = list_for(ctx)
+    async with stores.use(name) as store:
+        yield name, store
+
+
+async def log(name: str, message: str):
     # TODO GLOBAL: Fix logging so that it logs who made what change.
-    for x in log_channels:
-        await x.send(message)
+    # This only queues the message, the list's log channels get it a couple seconds later, bundled with whatever else came in.
+    await log_pipeline.put(name, message)
 
 
 @bot.event
 async def on_ready():
-    # Empty the channels here, so that on dropped connection we don't dupe logs and do extra work on sync events
-    list_channels.clear()
-    log_channels.clear()
-    # Add each channel to the list of list/log channels
-    for c_guild in bot.guilds:
-        for c_channel in c_guild.text_channels:
-            c_channel: discord.TextChannel
-            # Short circuit topic existance check, 2nd half fails if channel has no topic
-            if c_channel.topic and "<yuzu-compat: list>" in c_channel.topic:
-                list_channels.append(c_channel)
-                console.log(f"Got list channel: {c_channel.name} in {c_channel.guild.name}")
-            # list channels take priority
-            if c_channel.topic and "<yuzu-compat: log>" in c_channel.topic and c_channel not in list_channels:
-                log_channels.append(c_channel)
-                console.log(f"Got log channel: {c_channel.name} in {c_channel.guild.name}")
+    # This runs again after every reconnect, so it only looks up the channels we already know about.
+    # Checking every channel's topic happens in the background, and only every so often.
+    global last_reconcile
+    syncer.bot_user = bot.user
+    if not registry.kinds:
+        await registry.reconcile(bot.guilds)  # First start, we don't know any channels yet.
+        last_reconcile = time.monotonic()
+    registry.resolve(bot)
+    for c_channel in list_channels:
+        console.log(f"Got list channel: {c_channel.name} in {c_channel.guild.name}")
+    for c_channel in log_channels:
+        console.log(f"Got log channel: {c_channel.name} in {c_channel.guild.name}, for the {registry.list_of(c_channel.id)} list")
+    if last_reconcile is None or time.monotonic() - last_reconcile > reconcile_interval:
+        last_reconcile = time.monotonic()
+        asyncio.ensure_future(reconcile_channels())
+    global metrics_writer, snapshot_taker
+    if metrics_writer is None:
+        metrics_writer = asyncio.ensure_future(write_metrics())
+    if snapshot_taker is None:
+        snapshot_taker = asyncio.ensure_future(snapshots.run())
     console.log("--- We're ready to go. ---", style="green")
 
 
+async def reconcile_channels():
+    await asyncio.sleep(reconcile_delay)  # Let the reconnect settle first.
+    old_lists = {x for x in registry.kinds if registry.kind(x) == "list"}
+    await registry.reconcile(bot.guilds)
+    # New list channels get a full sync, since we've never synced them before.
+    for name in {registry.list_of(x) for x in registry.kinds if registry.kind(x) == "list" and x not in old_lists}:
+        queue_sync(name)
+
+
+def update_gauges():
+    loaded_lists.set(len(stores.stores))
+    loaded_games.set(sum(len(store.games) for store in stores.stores.values()))
+    known_channels.labels(kind="list").set(len(list_channels))
+    known_channels.labels(kind="log").set(len(log_channels))
+    deleted_messages.set(guard.deleted)
+
+
+async def write_metrics():
+    while True:
+        await asyncio.sleep(metrics_interval)
+        update_gauges()
+        try:
+            await asyncio.to_thread(write_atomic, metrics_location, metrics.prometheus())
+        except OSError as e:
+            console.log(f"Couldn't write {metrics_location}: {e}", style="red")
+
+
+@bot.before_invoke
+async def start_command_timer(ctx: commands.Context):
+    ctx.started = time.perf_counter()
+
+
+@bot.after_invoke
+async def stop_command_timer(ctx: commands.Context):
+    outcome = "failed" if ctx.command_failed else "ok"
+    command_seconds.labels(command=ctx.command.qualified_name, outcome=outcome).observe(time.perf_counter() - ctx.started)
+
+
+async def channel_changed(channel: discord.abc.GuildChannel):
+    if registry.update(channel):
+        await registry.save()
+        if registry.kind(channel.id) == "list":
+            queue_sync(registry.list_of(channel.id))
+
+
+@bot.event
+async def on_guild_channel_create(channel: discord.abc.GuildChannel):
+    await channel_changed(channel)
+
+
+@bot.event
+async def on_guild_channel_update(before: discord.abc.GuildChannel, after: discord.abc.GuildChannel):
+    await channel_changed(after)
+
+
+@bot.event
+async def on_guild_channel_delete(channel: discord.abc.GuildChannel):
+    if registry.remove(channel.id):
+        await registry.save()
+    if list_map.channels.pop(channel.id, None) is not None:
+        await list_map.save()
+
+
+@bot.event
+async def on_guild_join(guild: discord.Guild):
+    if registry.scan_guild(guild):
+        await registry.save()
+        for name in registry.lists(guild.id):
+            queue_sync(name)
+
+
+@bot.event
+async def on_guild_remove(guild: discord.Guild):
+    if registry.remove_guild(guild.id):
+        await registry.save()
+
+
+@bot.listen("on_message")
+async def guard_list_channels(message: discord.Message):
+    # A listener rather than on_message itself, so commands keep working (even in list channels, the message still goes).
+    if message.author != bot.user and registry.kind(message.channel.id) == "list":
+        guard.handle(message)
+
+
 @bot.event
 async def on_error(error, *args, **kwargs):
     console.log(traceback.Traceback())
@@ -241,6 +342,8 @@ async def kill(ctx: commands.Context):
     await ctx.send(":pensive::gun:")
     await bot.change_presence(status=Status.offline)
     console.log("Goodbye, world", style="red")
+    await stores.flush()
+    await log_pipeline.flush()
     await bot.logout()
 
 
@@ -262,12 +365,12 @@ async def eval_stuff(ctx: commands.Context, *, code: str):
 
 
 @commands.check(valid_user_check)
-@commands.check(db_access)
 @bot.command(brief="Adds, edits, or deletes attributes",
              help=multiline("""
     Edits the attributes of a game.
 
-    <game_number> is the number of the game, as shown in the list channel.
+    <game> is the number of the game, as shown in the list channel, or its name.
+        Names with spaces need quotes, like "Super Mario Odyssey". Close enough is fine, see >find.
     <category> must be "functional", "broken", "crashes", "recommendedsettings", or "notes".
     <attribute_num> is the number next to the attribute you want to edit.
         To add an attribute, use the number one higher than the highest one.
@@ -276,85 +379,266 @@ async def eval_stuff(ctx: commands.Context, *, code: str):
 
     This action is logged.
     """))
-async def edit(ctx: commands.Context, game_number: int, category: str, attribute_num: int, *, text: str):
-    with JsonFile(database_location) as games:
-        if not 1 <= game_number <= len(games):  # If 2 games, be between 1 and 2 incl.
-            raise BadArgument(f"game_number must be between 1 and {len(games)} inclusive.")
-        if category not in ["functional", "broken", "crashes", "recommendedsettings", "notes"]:
-            raise BadArgument('category must be one of ["functional","broken","crashes","recommendedsettings","notes"]')
-        if not 1 <= attribute_num <= len(games[game_number-1][category])+1:  # if 3 attributes, must be between 1 and 4
-            raise BadArgument(f"attribute_num must be between 1 and {len(games[game_number-1][category])+1} inclusive.")
-            # TODO Show present attributes and a +1 for add new one.
-        if not text:
-            raise BadArgument("text is a required parameter. If you intended to delete the attribute, use \"delete\".")
-        if attribute_num == len(games[game_number-1][category])+1 and text == "delete":
-            raise BadArgument("You cannot simultaneously create and delete an attribute.")
-        # Add attrib
-        if attribute_num == len(games[game_number-1][category])+1:
-            games[game_number-1][category].append(text)
-            await log(f"```diff\nAttribute in \"{category}\" added for {games[game_number-1]['name']}:\n+ {text}\n@{ctx.author}\n```")
-        # Remove attrib
-        elif text.lower() == "delete":
-            oldtext = games[game_number-1][category][attribute_num-1]
-            games[game_number-1][category].pop(attribute_num-1)
-            await log(f"```diff\nAttribute in \"{category}\" removed for {games[game_number-1]['name']}:\n- {oldtext}\n@{ctx.author}\n```")
-        # Update attrib
-        else:
-            oldtext = games[game_number-1][category][attribute_num-1]
-            games[game_number-1][category][attribute_num-1] = text
-            await log(f"```diff\nAttribute in \"{category}\" updated for {games[game_number-1]['name']}:\n- {oldtext}\n+ {text}\n@{ctx.author}\n```")
-    console.log(f"Attribute modified: [green]{category}:{attribute_num}[/green] for [green]{games[game_number-1]['name']}[/green].", style="blue")
-    await sync(ctx)
+async def edit(ctx: commands.Context, game: str, category: str, attribute_num: int, *, text: str):
+    async with store_for(ctx) as (name, store), store:
+        game = find_game(store, game)
+        change, diff = edit_change(game, category, attribute_num, text)
+        await store.apply(change, str(ctx.author))
+        await log(name, f"```diff\n{diff}\n@{ctx.author}\n```")
+    console.log(f"Attribute modified: [green]{category}:{attribute_num}[/green] for [green]{game.name}[/green].", style="blue")
     await ctx.message.add_reaction("👍")
+    queue_sync(name, ctx.message)
+
+
+def edit_change(game: Game, category: str, attribute_num: int, text: str) -> tuple[dict, str]:
+    # Checks an edit and works out the change for the store, plus what it looks like in the log. Doesn't change anything.
+    if category not in categories:
+        raise BadArgument('category must be one of ["functional","broken","crashes","recommendedsettings","notes"]')
+    attributes = game.attributes(category)
+    if not 1 <= attribute_num <= len(attributes)+1:  # if 3 attributes, must be between 1 and 4
+        raise BadArgument(f"attribute_num must be between 1 and {len(attributes)+1} inclusive.")
+        # TODO Show present attributes and a +1 for add new one.
+    if not text:
+        raise BadArgument("text is a required parameter. If you intended to delete the attribute, use \"delete\".")
+    if attribute_num == len(attributes)+1 and text == "delete":
+        raise BadArgument("You cannot simultaneously create and delete an attribute.")
+    # Add attrib
+    if attribute_num == len(attributes)+1:
+        return ({"op": "append", "id": game.id, "category": category, "text": text},
+                f"Attribute in \"{category}\" added for {game.name}:\n+ {text}")
+    # Remove attrib
+    oldtext = attributes[attribute_num-1]
+    if text.lower() == "delete":
+        return ({"op": "delete", "id": game.id, "category": category, "index": attribute_num-1},
+                f"Attribute in \"{category}\" removed for {game.name}:\n- {oldtext}")
+    # Update attrib
+    return ({"op": "set", "id": game.id, "category": category, "index": attribute_num-1, "text": text},
+            f"Attribute in \"{category}\" updated for {game.name}:\n- {oldtext}\n+ {text}")
 
 
 @commands.check(valid_user_check)
-@commands.check(db_access)
 @bot.command(brief="Renames a game",
              help=multiline("""
-    Renames a game, pretty simple. Use the ID number in the compatability list.
+    Renames a game, pretty simple. Use the number shown in the compatability list, or the current name (in quotes if it has spaces).
 
     This action is logged.
     """))
-async def rename(ctx: commands.Context, game_number: int, *, new_name: str):
-    with JsonFile(database_location) as games:
-        if not 1 <= game_number <= len(games):  # If 2 games, be between 1 and 2 incl.
-            raise BadArgument(f"game_number must be between 1 and {len(games)} inclusive.")
+async def rename(ctx: commands.Context, game: str, *, new_name: str):
+    async with store_for(ctx) as (name, store), store:
+        game = find_game(store, game)
         if not new_name:
             raise BadArgument("new_name is a required parameter.")
         else:
-            oldtext = games[game_number-1]["name"]
-            games[game_number-1]["name"] = new_name
-            await log(f"```diff\nRenamed game:\n- {oldtext}\n+ {new_name}\n@{ctx.author}\n```")
-    await sync(ctx)
+            oldtext = game.name
+            await store.apply({"op": "rename", "id": game.id, "name": new_name}, str(ctx.author))
+            await log(name, f"```diff\nRenamed game:\n- {oldtext}\n+ {new_name}\n@{ctx.author}\n```")
     await ctx.message.add_reaction("👍")
+    queue_sync(name, ctx.message)
 
 
 @commands.check(valid_user_check)
-@commands.check(db_access)
 @bot.command(brief="Adds a blank game to the list",
              help=multiline("""
-    Creates a game named <gamename> and adds it to the list (and then syncs the list).
+    Creates a game named <gamename> and adds it to the list (and then syncs the list in the background).
     To add attributes, use >edit. 
     
     This action is logged.
     """))
 async def add_game(ctx: commands.Context, *, gamename: str):
-    new_game = {
-        "name": gamename,
-        "functional": [],
-        "broken": [],
-        "crashes": [],
-        "recommendedsettings": [],
-        "notes": [],
-    }
-    with JsonFile(database_location) as games:
-        games.append(new_game)
+    async with store_for(ctx) as (name, store), store:
+        new_game = (await store.apply({"op": "add", "game": Game(gamename).to_dict()}, str(ctx.author)))["game"]
     console.log(f"Added game [green]{gamename}[/green]", style="blue")
-    await log(f"```diff\nAdded game:\n+{gamename}\n@{ctx.author}\n```")
-    await sync(ctx)
-    with JsonFile(database_location) as games:
-        await ctx.send(f"Added game {games.index(new_game)+1}.")
+    await log(name, f"```diff\nAdded game:\n+{gamename}\n@{ctx.author}\n```")
+    await ctx.send(f"Added game {new_game['id']}.")
+    queue_sync(name, ctx.message)
+
+
+@commands.check(valid_user_check)
+@bot.command(brief="Makes a bunch of changes at once",
+             help=multiline("""
+    Makes lots of changes in one go, listed after the command (one per line), or in an attached .json or .csv file.
+    Lines look like the commands they stand for, without the >:
+        add_game Some New Game
+        rename 12 Its New Name
+        edit "Super Mario Odyssey" notes 3 Some text, or delete
+    A .json file is a list of {"op": "add_game", "name": ...}, {"op": "rename", "game": ..., "name": ...}
+    and {"op": "edit", "game": ..., "category": ..., "number": ..., "text": ...}.
+    A .csv file has the columns op, game, category, number and text (the name goes in text for add_game and rename).
+
+    Everything gets checked before anything changes, so if one change is wrong, none of them happen.
+    Games added earlier in a batch can be edited later in it, by number or by name.
+
+    This action is logged, as one entry.
+    """))
+async def batch(ctx: commands.Context, *, text: str = ""):
+    if ctx.message.attachments:
+        attachment = ctx.message.attachments[0]
+        operations = read_batch_file(attachment.filename, await attachment.read())
+    else:
+        operations = read_batch_lines(text)
+    if not operations:
+        raise BadArgument("There's nothing in that batch. Put changes after the command, one per line, or attach a file.")
+    async with store_for(ctx) as (name, store), store:
+        changes, diffs = plan_batch(store, operations)
+        await store.apply({"op": "batch", "changes": changes}, str(ctx.author))
+    console.log(f"Made a batch of [green]{len(changes)}[/green] changes.", style="blue")
+    await log(name, f"```diff\nBatch of {len(changes)} changes:\n" + "\n".join(diffs) + f"\n@{ctx.author}\n```")
+    await ctx.send(f"Made {len(changes)} changes.")
+    queue_sync(name, ctx.message)
+
+
+def split_args(line: str, count: int) -> list[str]:
+    # Splits off `count` arguments like the commands do (quotes keep words together), then the rest of the line.
+    # Missing ones come back empty.
+    args = []
+    rest = line.strip()
+    for _ in range(count):
+        match = re.match(r'"([^"]*)"\s*|(\S+)\s*', rest)
+        if not match:
+            break
+        args.append(match.group(1) if match.group(1) is not None else match.group(2))
+        rest = rest[match.end():]
+    return args + [""] * (count - len(args)) + [rest]
+
+
+def read_batch_lines(text: str) -> list[tuple[str, dict]]:
+    # Turns the lines after >batch into operations, along with where each came from for error messages.
+    operations = []
+    for number, line in enumerate(text.splitlines(), 1):
+        if not line.strip() or line.strip().startswith("```"):
+            continue  # Blank lines, and code block fences if someone pasted it in one.
+        op, rest = split_args(line, 1)
+        if op == "rename":
+            game, new_name = split_args(rest, 1)
+            operations.append((f"line {number}", {"op": op, "game": game, "name": new_name}))
+        elif op == "edit":
+            game, category, attribute_num, edit_text = split_args(rest, 3)
+            operations.append((f"line {number}", {"op": op, "game": game, "category": category, "number": attribute_num, "text": edit_text}))
+        else:
+            operations.append((f"line {number}", {"op": op, "name": rest}))
+    return operations
+
+
+def read_batch_file(file_name: str, data: bytes) -> list[tuple[str, dict]]:
+    if not file_name.lower().endswith((".json", ".csv")):
+        raise BadArgument("Batch files have to be .json or .csv.")
+    try:
+        # utf-8-sig skips the byte order mark Excel puts at the start of CSVs, and reads files without one just the same.
+        data = data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise BadArgument("Batch files have to be UTF-8. In Excel, save it as \"CSV UTF-8\".")
+    if file_name.lower().endswith(".json"):
+        try:
+            items = json.loads(data)
+        except ValueError as error:
+            raise BadArgument(f"That isn't valid JSON: {error}")
+        if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+            raise BadArgument("The JSON file should be a list of objects, see >help batch.")
+        return [(f"item {number}", item) for number, item in enumerate(items, 1)]
+    operations = []
+    # Row 1 is the header, so the first change is on row 2, same as a spreadsheet shows it.
+    for number, row in enumerate(csv.DictReader(io.StringIO(data)), 2):
+        row = {key: value or "" for key, value in row.items() if key}
+        if row.get("op") in ("add_game", "rename"):
+            row["name"] = row.get("text", "")
+        operations.append((f"row {number}", row))
+    return operations
+
+
+def plan_batch(store: GameStore, operations: list[tuple[str, dict]]) -> tuple[list[dict], list[str]]:
+    """
+    Checks a whole batch and works out the changes for the store, plus what they look like in the log, without
+    changing anything. Changes are tried out on copies of the games, so later ones see what earlier ones did.
+    Raises BadArgument with everything that's wrong, if anything is.
+    """
+    games: dict[int, Game] = {}  # game number -> copy of every game the batch touches
+    added: dict[str, int] = {}  # casefolded name -> game number, for games added in this batch
+    next_id = store.next_id  # Same order the store numbers them in, so the batch can refer to new games by number.
+    changes = []
+    diffs = []
+    errors = []
+
+    def lookup(query) -> Game:
+        query = str(query or "").strip()
+        if not query:
+            raise BadArgument("Which game?")
+        if query.strip("[]#").isdigit() and int(query.strip("[]#")) in games:
+            return games[int(query.strip("[]#"))]
+        if query.casefold() in added:
+            return games[added[query.casefold()]]
+        game = find_game(store, query)
+        return games.setdefault(game.id, game.copy())
+
+    for where, operation in operations:
+        try:
+            op = operation.get("op")
+            if op in ("add_game", "add"):
+                new_name = str(operation.get("name") or "").strip()
+                if not new_name:
+                    raise BadArgument("New games need a name.")
+                games[next_id] = Game(new_name, next_id)
+                added[new_name.casefold()] = next_id
+                next_id += 1
+                changes.append({"op": "add", "game": Game(new_name).to_dict()})
+                diffs.append(f"Added game:\n+{new_name}")
+            elif op == "rename":
+                game = lookup(operation.get("game"))
+                new_name = str(operation.get("name") or "").strip()
+                if not new_name:
+                    raise BadArgument("new_name is a required parameter.")
+                changes.append({"op": "rename", "id": game.id, "name": new_name})
+                diffs.append(f"Renamed game:\n- {game.name}\n+ {new_name}")
+                game.name = new_name
+            elif op == "edit":
+                game = lookup(operation.get("game"))
+                try:
+                    attribute_num = int(operation.get("number"))
+                except (TypeError, ValueError):
+                    raise BadArgument(f"attribute_num has to be a number, not \"{operation.get('number')}\".")
+                change, diff = edit_change(game, str(operation.get("category") or ""), attribute_num, str(operation.get("text") or ""))
+                apply_change([], games, change)
+                changes.append(change)
+                diffs.append(diff)
+            else:
+                raise BadArgument(f"\"{op}\" isn't something a batch can do. Use add_game, rename or edit.")
+        except BadArgument as error:
+            errors.append(f"{where}: {error}")
+    if errors:
+        shown = "\n".join(errors[:10]) + (f"\n...and {len(errors) - 10} more." if len(errors) > 10 else "")
+        raise BadArgument(f"Nothing was changed, because of these:\n{shown}")
+    return changes, diffs
+
+
+@bot.command(brief="Finds games by name",
+             help=multiline("""
+    Shows the games with names closest to <query>, along with their numbers.
+    Typos and missing words are fine, it's meant for finding the number to use with >edit and >rename.
+    """))
+async def find(ctx: commands.Context, *, query: str):
+    async with store_for(ctx) as (_, store):
+        results = store.search(query, 10)
+    if not results:
+        await ctx.send(f"Nothing's called anything like \"{query}\".")
+        return
+    await ctx.send("```markdown\n" + "\n".join(f"[{game.id:03}]: {game.name}" for _, game in results) + "\n```")
+
+
+def find_game(store: GameStore, query: str) -> Game:
+    # Turns what someone typed into a game: a number if it's a number, otherwise the name it's clearly closest to.
+    if query.strip("[]#").isdigit():
+        game = store.find(int(query.strip("[]#")))
+        if game is None:
+            raise BadArgument(f"There's no game number {query.strip('[]#')}.")
+        return game
+    results = store.search(query, 5)
+    if not results:
+        raise BadArgument(f"No game is called anything like \"{query}\". Try >find.")
+    best = results[0][0]
+    runner_up = results[1][0] if len(results) > 1 else 0
+    if best == 1.0 and runner_up < 1.0 or best >= search_confidence and best - runner_up >= search_margin:
+        return results[0][1]
+    candidates = ", ".join(f"[{game.id:03}] {game.name}" for _, game in results)
+    raise BadArgument(f"\"{query}\" could be a few games, use the number instead: {candidates}")
 
 
 @bot.command(brief="Removes bot DMs",
@@ -362,88 +646,70 @@ async def add_game(ctx: commands.Context, *, gamename: str):
     This will delete any DMs from the bot to you, like decodes.
     """))
 async def clear_dm(ctx: commands.Context):
-    messages = await ctx.author.create_dm()
-    messages = await messages.history(limit=None).flatten()
-    for x in messages:
+    dm = await ctx.author.create_dm()
+    # Bulk deletes don't work in DMs, so this goes one at a time, but at least we don't load the whole DM first.
+    async for x in dm.history(limit=None):
         x: discord.Message
         if x.author == bot.user:
-            await x.delete()
+            try:
+                await x.delete()
+            except discord.NotFound:
+                pass
     await ctx.message.add_reaction("👍")
 
 
-@commands.max_concurrency(1, per=BucketType.default)
 @commands.check(valid_user_check)
-@commands.check(db_access)
 @bot.command(brief="Updates all compatibility lists, trying to do the least work",
              help=multiline("""
-    Validates the list of games in every server, and updates them accordingly.
-    If non-bot messages are present, deletes them and reprimands the author via DM.
-    (reprimands can be disabled by adding <yuzu-compat: noreprimand> to the channel topic.)
-    If more messages then games are present, deletes the extras.
-    If less are present, sends placeholders.
-    Then, it goes through the list and edits the messages so they match up with game order. 
-    
-    If somebody messages while a sync is taking place, things will break.
-    In that case, the bot will do a fallback hardsync. Don't do it. It sucks. It's slow.
+    Updates every channel showing this server's list.
+    Edits already do this on their own, a few seconds after the last one, so this is mostly for checking on things.
+    Normally this only edits the messages for games that changed since the last sync, without reading the channels.
+    Games that moved get shifted into the nearest empty slot, so adding one doesn't rewrite the whole list.
+    `>sync plan` just says how many messages each channel would need sent, edited and deleted.
+
+    `>sync full` checks every list channel from top to bottom instead, which is much slower.
+    It deletes anything that isn't the bot's, evens out the number of messages, and fixes any that are wrong.
+    Channels the bot hasn't synced before always get a full sync.
+
+    Channels with <yuzu-compat: packed> in the topic get as many games in each message as will fit.
+    Channels with <yuzu-compat: list:name> in the topic show a separate list called name, instead of the default one.
+    In a server with a few lists, commands use whichever one <yuzu-compat: commands:name> in the channel topic says.
+
+    Messages from anyone else in a list channel get deleted as soon as they're sent, and the author gets a DM about it
+    (at most once an hour). Add <yuzu-compat: noreprimand> to the channel topic to skip the DM.
     """))
-async def sync(ctx: commands.Context):
-    with JsonFile(database_location) as games:
-        # Sort the list of games
-        games: list
-        games.sort(key=lambda game: game["name"].casefold())
-        # console.log(games)
-    with JsonFile(database_location, "r") as games:
-        for channel in list_channels:
-            with channel.typing() as _:
-                console.log(f"Syncing <{channel.name}> in <{channel.guild.name}>.", style="green")
-                # Get a list of all messages in chron. order.
-                messages = await channel.history(oldest_first=True, limit=None).flatten()
-                # Check through the messages and make sure that they are mine, delete otherwise
-                # <
-                authors_reprimanded = []
-                messages_to_delete = []
-                for message in messages:
-                    message: discord.Message
-                    if message.author != bot.user:
-                        # If message is someone else's, reprimand them.
-                        if "<yuzu-compat: noreprimand>" not in message.channel.topic and message.author not in authors_reprimanded:
-                            await message.author.send(
-                                f"Please don't send messages in `#{message.channel.name}` in `{message.channel.guild.name}`. It'll break things.")
-                            # Don't spam the user, add them to the exempt list temporarily.
-                            authors_reprimanded.append(message.author)
-                        # Don't delete the message now, as it'll mess up ordering.
-                        messages_to_delete.append(message)
-                del(authors_reprimanded)  # We don't need this anymore, and it'll be in scope for a while. idk
-                # >
-                # Delete the above found messages, and re-get a new list. Assume no messages in this time, and then check if len(messages) = len(games)
-                # <
-                for message in messages_to_delete:
-                    await message.delete()
-                messages = await channel.history(oldest_first=True, limit=None).flatten()
-                messages = [x for x in messages if x.author == bot.user]
-                # If there are more messages than games, delete the last X messages, evening them out.
-                if len(messages) > len(games):
-                    for _ in range(len(messages) - len(games)):
-                        await messages.pop().delete()
-                # If there are more, send placeholder messages.
-                if len(messages) < len(games):
-                    for _ in range(len(games) - len(messages)):
-                        messages.append(await channel.send(
-                            "```diff\n- Placeholder. Please hold. If this persists for 2 minutes, ping typecasto#0517.\n```"))
-                # Just to be sure, let's make sure the lengths are equal.
-                if len(messages) != len(games):
-                    repair(ctx, channel)
-                    return
-
-                for num, message in enumerate(messages):
-                    game_message = convert_game_dict_to_message(games[num], num+1)
-                    if message.content != game_message:
-                        await message.edit(content=game_message)
-    console.log("Done.", style="green")
+async def sync(ctx: commands.Context, mode: str = "quick"):
+    if mode not in ["quick", "full", "plan"]:
+        raise BadArgument('mode must be "quick", "full" or "plan".')
+    name = list_for(ctx)
+    if mode == "quick":
+        # Join whatever background sync is coming up rather than running another one next to it.
+        await syncer.queue_for(name).request()
+    elif mode == "plan":
+        await ctx.send("\n".join(await syncer.sync(name, mode)) or "There aren't any list channels.")
+    else:
+        await syncer.sync(name, mode)
+    await ctx.message.add_reaction("👍")
+
+
+def queue_sync(name: str, message: Optional[discord.Message] = None):
+    # Edits don't wait for the list channels, they ask for a background sync and optionally react again once it's done.
+    # Without a message, failures only end up in the console.
+    done = syncer.queue_for(name).request()
+    done.add_done_callback(lambda done: asyncio.ensure_future(react_when_synced(message, done)))
+
+
+async def react_when_synced(message: Optional[discord.Message], done: asyncio.Future):
+    error = done.exception()
+    if error is not None:
+        console.log(f"Background sync failed: {error!r}", style="red")
+        if message is not None:
+            await message.add_reaction("⚠️")
+    elif react_when_live and message is not None:
+        await message.add_reaction("✅")
 
 
 @commands.check(valid_user_check)
-@commands.check(db_access)
 @bot.command(brief="Fully destroys the list in a given channel and remakes it",
              help=multiline(f"""
     Deletes every message in <channel> and recreates the list completely.
@@ -451,30 +717,97 @@ async def sync(ctx: commands.Context):
     Avoid using this command unless the list of games is completely borked.
     Use >sync instead.
 
-    Can also be used to add a new list channel, since we don't check for those after the bot is started.
+    New list channels get picked up (and synced) on their own as soon as their topic is set, this isn't needed for them.
     """))
 async def repair(ctx: commands.Context, channel: discord.TextChannel):
-    if "<yuzu-compat: list>" not in channel.topic:
+    if channel_kind(channel) != "list":
         raise BadArgument(f"{channel} is not a valid list channel.")
-    elif channel not in list_channels:
-        list_channels.append(channel)
-    console.log(f"Repairing <{channel.name}> in <{channel.guild.name}>.", style="red bold")
-    messages = await channel.history(oldest_first=True, limit=None).flatten()
-    with channel.typing() as _:
-        while messages:
-            await messages.pop().delete()
-        with JsonFile(database_location, "r") as games:
-            for num, game in enumerate(games):
-                game_message = convert_game_dict_to_message(game, num+1)
-                await channel.send(game_message)
+    elif registry.update(channel):
+        await registry.save()
+    await syncer.repair(channel)
+
+
+@commands.is_owner()
+@bot.command(brief="Sends a compressed copy of the list to the current channel",
+             help=multiline("""
+    Sends the newest snapshot of the list (gzipped games.json), taking a fresh one first if anything changed since.
+    Give it the name of an older snapshot (see >snapshots) to only get what changed since that one instead:
+    {"base": that snapshot, "snapshot": the newest, "games": [new and changed games], "removed": [numbers of removed games]}.
+    """))
+async def backup(ctx: commands.Context, since: str = None):
+    name = list_for(ctx)
+    try:
+        if since is None:
+            snapshot = await snapshots.latest(name)
+            await ctx.send(file=discord.File(snapshots.path(name, snapshot), snapshot))
+        else:
+            snapshot, delta = await snapshots.delta(name, since)
+            await ctx.send(f"Changes from {since} to {snapshot}.", file=discord.File(io.BytesIO(delta), f"delta-{snapshot}"))
+    except FileNotFoundError as error:
+        raise BadArgument(str(error))
+
+
+@commands.is_owner()
+@bot.command(name="snapshots",
+             brief="Lists the snapshots kept of the list",
+             help=multiline(f"""
+    Lists the compressed snapshots kept of the list, oldest first. They get taken every {snapshot_every} changes,
+    or every {snapshot_interval / 3600:g} hours if there were any changes at all, and the newest {snapshot_keep} are kept.
+    """))
+async def list_snapshots(ctx: commands.Context):
+    name = list_for(ctx)
+    taken = snapshots.snapshots(name)
+    if not taken:
+        await ctx.send(f"There are no snapshots of the {name} list yet.")
+        return
+    for part in split_message("```\n" + "\n".join(taken) + "\n```"):
+        await ctx.send(part)
 
 
 @commands.check(db_access)
 @commands.is_owner()
-@bot.command(brief="Sends a copy of games.json to the current channel")
-async def backup(ctx: commands.Context):
-    jsonfile = discord.File(database_location, "games.json")
-    await ctx.send(file=jsonfile)
+@bot.command(brief="Puts the list back the way it was in a snapshot",
+             help=multiline("""
+    Replaces the whole list with the snapshot called <snapshot> (see >snapshots), or with an attached games.json or
+    games.json.gz. The list gets snapshotted first, so a restore can be undone with another one.
+    """))
+async def restore(ctx: commands.Context, snapshot: str = None):
+    async with store_for(ctx) as (name, store):
+        try:
+            if ctx.message.attachments:
+                attachment = ctx.message.attachments[0]
+                data = await attachment.read()
+                if attachment.filename.lower().endswith(".gz"):
+                    data = gzip.decompress(data)
+                games = validate_games(json.loads(data))
+                snapshot = attachment.filename
+            elif snapshot is not None:
+                games = await asyncio.to_thread(snapshots.read, name, snapshot)
+            else:
+                raise BadArgument("Say which snapshot to restore (see >snapshots), or attach a games.json.")
+        except (OSError, ValueError) as error:
+            raise BadArgument(f"Couldn't restore that: {error}")
+        # Snapshot and restore in one go, so no change can land in between and get lost.
+        async with store:
+            before = await snapshots.take_locked(name, store)
+            await store.apply({"op": "restore", "games": games}, str(ctx.author))
+    console.log(f"Restored the {name} list from [green]{snapshot}[/green].", style="blue")
+    await log(name, f"```diff\nRestored the {name} list from {snapshot} ({len(games)} games), it was saved as {before}.\n@{ctx.author}\n```")
+    await ctx.send(f"Restored {len(games)} games from {snapshot}. What was there before is in {before}.")
+    queue_sync(name, ctx.message)
+
+
+@commands.is_owner()
+@bot.command(brief="Shows how long things are taking",
+             help=multiline(f"""
+    Shows command latencies, discord calls by kind, time spent rate limited, database load and save times,
+    and how long rendering games takes, all since the bot started.
+    The same numbers get written to {metrics_location} every {metrics_interval:g} seconds, for Prometheus.
+    """))
+async def stats(ctx: commands.Context):
+    update_gauges()
+    for part in split_message("```\n" + metrics.summary() + "\n```"):
+        await ctx.send(part)
 
 
 # @bot.check
@@ -488,4 +821,7 @@ with open("token", "r") as file:
     token = file.read()
 token.removesuffix("\n")
 bot.owner_id = 134509976956829697
+list_map.load()
+registry.load()
+rate_limits.install()
 bot.run(token)